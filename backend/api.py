@@ -1,6 +1,53 @@
-from fastapi import FastAPI
+import asyncio
+import codecs
+import hashlib
+import math
+import os
+import threading
+from collections import Counter
+from contextlib import asynccontextmanager, contextmanager
+
+from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from sim import run_sim, format_train_segments
+from starlette.concurrency import run_in_threadpool
+from sim import (
+    run_sim, format_train_segments, warm_up, set_block_lengths, SimulationCancelled,
+    NUM_BLOCKS, CORRIDOR_BLOCK_LENGTHS
+)
+from runs import (
+    Run, get_run, put_run, clear_runs, scenario_key, parse_station, get_timetable, put_timetable,
+    delta_response
+)
+from timetable import StreamCompiler, TimetableError
+from plots import render_distance_time
+from tiles import build_tile
+from compare import compare_runs
+from replication import replicate
+
+MAX_REPLICATIONS = 200
+
+# ----------------------------------------------------------
+# STARTUP WARM-UP
+# ----------------------------------------------------------
+# SIM_WARMUP=0 disables it (e.g. for `uvicorn --reload` while editing).
+# pandas and the simulation path are not imported at module load; the warm-up
+# loads them in a background thread so the worker starts serving at once and
+# the first real /simulate does not pay for them.
+SIM_WARMUP = os.getenv("SIM_WARMUP", "1") != "0"
+
+
+def _warm_up():
+    _sync_corridor()
+    with _sim_lock:
+        warm_up()
+
+
+@asynccontextmanager
+async def lifespan(app):
+    if SIM_WARMUP:
+        threading.Thread(target=_warm_up, name="sim-warmup", daemon=True).start()
+    yield
+
 
 # ----------------------------------------------------------
 # FASTAPI APP CONFIG
@@ -8,7 +55,8 @@ from sim import run_sim, format_train_segments
 app = FastAPI(
     title="Rail Simulation API",
     description="Backend Simulation for Train Distance-Time visualization",
-    version="1.0"
+    version="1.0",
+    lifespan=lifespan
 )
 
 # ----------------------------------------------------------
@@ -44,54 +92,559 @@ def parse_speed_up(speed_up: str):
             speed_dict[int(blk)] = float(mul)
     return speed_dict
 
+# ----------------------------------------------------------
+# RUN EXECUTION (cached per scenario)
+# ----------------------------------------------------------
+# run_sim keeps its KPI accumulators in module globals -> one run at a time
+_sim_lock = threading.Lock()
+
+# simulations.completed / cache_hits / cancelled.<reason>, served by /metrics
+metrics = Counter()
+
+
+@contextmanager
+def _sim_slot(cancel=None):
+    """Hold _sim_lock; a cancelled request stops waiting for it."""
+    while not _sim_lock.acquire(timeout=0.05):
+        if cancel is not None and cancel.is_set():
+            raise SimulationCancelled()
+    try:
+        yield
+    finally:
+        _sim_lock.release()
+
+
+class _CorridorLock:
+    """
+    Guards sim.station_pos / CORRIDOR_BLOCK_LENGTHS, which set_block_lengths
+    rewrites in place. Views built from a run (index, charts, tiles,
+    /compare timings) read them under shared(); the swap waits for those
+    readers under exclusive(), and new readers wait for the swap.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._readers = 0
+
+    @contextmanager
+    def shared(self):
+        with self._cond:
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def exclusive(self):
+        with self._cond:
+            self._cond.wait_for(lambda: not self._readers)
+            yield
+
+
+_corridor_lock = _CorridorLock()
+
+
+# ----------------------------------------------------------
+# CORRIDOR FROM THE /infra BLOCK TABLE
+# ----------------------------------------------------------
+# Block lengths come from the cached /infra snapshot (app.infra_cache), so
+# after the first read there is no DB round-trip per run. An empty table or
+# one with another block count keeps the built-in corridor.
+# Opt-in with SIM_CORRIDOR_FROM_DB=1: it connects to the app.db database
+# (sqlite file relative to the working directory by default), and the
+# snapshot is only invalidated by writes made in this process.
+_corridor_from_db = os.getenv("SIM_CORRIDOR_FROM_DB", "0") == "1"
+
+
+def _db_block_lengths():
+    global _corridor_from_db
+    if not _corridor_from_db:
+        return None
+    try:
+        from app.infra_cache import block_lengths
+        lengths = block_lengths()
+    except Exception as e:  # no table / unreachable DB / missing driver
+        print(f"⚠ Corridor from DB disabled, using built-in block lengths: {str(e).splitlines()[0]}")
+        _corridor_from_db = False
+        return None
+    return lengths if len(lengths) == NUM_BLOCKS else None
+
+
+def _sync_corridor(cancel=None):
+    lengths = _db_block_lengths()
+    if lengths is None or list(lengths) == CORRIDOR_BLOCK_LENGTHS:
+        return
+    with _sim_slot(cancel), _corridor_lock.exclusive():
+        # cached runs were simulated on the old corridor
+        if set_block_lengths(lengths):
+            clear_runs()
+
+
+def run_scenario(auto_blocks_list, loops_list, speed_dict, timetable_id="", cancel=None):
+    _sync_corridor(cancel)
+    run_id = scenario_key(auto_blocks_list, loops_list, speed_dict, timetable_id)
+    run = get_run(run_id)
+    if run is not None:
+        metrics["simulations.cache_hits"] += 1
+        return run
+
+    timetable = None
+    if timetable_id:
+        timetable = get_timetable(timetable_id)
+        if timetable is None:
+            raise HTTPException(status_code=404, detail=f"Unknown or expired timetable_id {timetable_id}")
+
+    with _sim_slot(cancel):
+        run = get_run(run_id)
+        if run is not None:
+            metrics["simulations.cache_hits"] += 1
+            return run
+
+        (
+            df,
+            simulation_time,
+            block_wait,
+            block_usage,
+            station_wait,
+            station_usage,
+            freight_finished,
+            avg_frt_time,
+            avg_frt_speed
+        ) = run_sim(
+            "API",
+            auto_blocks=auto_blocks_list,
+            loop_stations=loops_list,
+            speed_up_blocks=speed_dict,
+            timetable=timetable,
+            cancel=cancel
+        )
+        metrics["simulations.completed"] += 1
+        passenger_cutoff = timetable.num_passenger if timetable is not None else None
+
+        response = {
+            "run_id": run_id,
+            "simulation_time_hours": round(simulation_time, 2),
+            "timetable_id": timetable_id or None,
+            "infrastructure": {
+                "auto_blocks": auto_blocks_list,
+                "loop_stations": loops_list,
+                "speed_up_blocks": speed_dict
+            },
+            "freight_stats": {
+                "finished_trains": int(freight_finished),
+                "average_travel_time_hours": round(avg_frt_time, 2) if freight_finished > 0 else 0.0,
+                "average_speed_kmph": round(avg_frt_speed, 1) if freight_finished > 0 else 0.0
+            },
+            "trains": format_train_segments(
+                df, passenger_cutoff, timetable.names if timetable is not None else None
+            )
+        }
+
+        return put_run(Run(run_id, df, response, passenger_cutoff))
+
+
+def resolve_run(run_id, auto_blocks, loops, speed_up, timetable_id=""):
+    """A cached run by id, or the (possibly cached) run of the given scenario."""
+    if run_id:
+        run = get_run(run_id)
+        if run is None:
+            raise HTTPException(status_code=404, detail=f"Unknown or expired run_id {run_id}")
+        return run
+    return run_scenario(parse_auto_blocks(auto_blocks), parse_loops(loops),
+                        parse_speed_up(speed_up), timetable_id)
+
+
 # ----------------------------------------------------------
 # MAIN SIMULATION ENDPOINT
 # ----------------------------------------------------------
+class CancelToken(threading.Event):
+    """threading.Event that remembers why it was set."""
+    reason = None
+
+    def cancel(self, reason):
+        if not self.is_set():
+            self.reason = reason
+            self.set()
+
+
+# session -> (run_id, token) of its in-flight /simulate
+_session_runs = {}
+_session_lock = threading.Lock()
+DISCONNECT_POLL_SEC = 0.1
+
+
 @app.get("/simulate")
-def simulate(
+async def simulate(
+    request: Request,
     auto_blocks: str = "",
     loops: str = "",
-    speed_up: str = ""
+    speed_up: str = "",
+    timetable_id: str = "",
+    session: str = "",
+    since: str = ""
 ):
     """
     Query Example:
     /simulate?auto_blocks=6,7,8&loops=10,13&speed_up=17:1.5,18:1.2
+    /simulate?timetable_id=<id from POST /timetables>&loops=10
+    /simulate?loops=10,14&since=<run_id of the result the client holds>
+
+    With `since`, "trains" is replaced by a "delta" holding only the trains
+    whose content hash changed, plus added / removed train ids. If that
+    run has expired from the store, the full response is returned.
+
+    The run is cancelled if the client disconnects, or if the same
+    `session` submits a different scenario before this one finishes.
     """
 
     auto_blocks_list = parse_auto_blocks(auto_blocks)
     loops_list = parse_loops(loops)
     speed_dict = parse_speed_up(speed_up)
 
-    (
-        df,
-        simulation_time,
-        block_wait,
-        block_usage,
-        station_wait,
-        station_usage,
-        freight_finished,
-        avg_frt_time,
-        avg_frt_speed
-    ) = run_sim(
-        "API",
-        auto_blocks=auto_blocks_list,
-        loop_stations=loops_list,
-        speed_up_blocks=speed_dict
-    )
-
-    response = {
-        "simulation_time_hours": round(simulation_time, 2),
+    token = CancelToken()
+    run_id = scenario_key(auto_blocks_list, loops_list, speed_dict, timetable_id)
+    if session:
+        with _session_lock:
+            prev = _session_runs.get(session)
+            # a repeat of the same scenario (e.g. polling) just shares its result
+            if prev is not None and prev[0] != run_id:
+                prev[1].cancel("superseded")
+            _session_runs[session] = (run_id, token)
+
+    work = asyncio.ensure_future(run_in_threadpool(
+        run_scenario, auto_blocks_list, loops_list, speed_dict, timetable_id, token
+    ))
+    try:
+        while not work.done():
+            await asyncio.wait({work}, timeout=DISCONNECT_POLL_SEC)
+            if not work.done() and await request.is_disconnected():
+                token.cancel("disconnected")
+        run = work.result()
+        prev = get_run(since) if since else None
+        return delta_response(run, prev) if prev is not None else run.response
+    except SimulationCancelled:
+        metrics[f"simulations.cancelled.{token.reason}"] += 1
+        raise HTTPException(status_code=499, detail=f"Simulation cancelled ({token.reason})")
+    except asyncio.CancelledError:
+        # the server dropped the request task itself: stop the run behind it
+        if not work.done():
+            token.cancel("disconnected")
+            metrics["simulations.cancelled.disconnected"] += 1
+        raise
+    finally:
+        if session:
+            with _session_lock:
+                if _session_runs.get(session, (None, None))[1] is token:
+                    del _session_runs[session]
+
+
+# ----------------------------------------------------------
+# TIMETABLE UPLOAD
+# ----------------------------------------------------------
+@app.post("/timetables")
+async def upload_timetable(request: Request, fmt: str = "csv"):
+    """
+    Body: the raw timetable file (csv | jsonl | json, see timetable.py).
+    Example:
+    curl --data-binary @wtt.csv "localhost:8000/timetables?fmt=csv"
+
+    The body is compiled chunk by chunk as it arrives.
+    """
+    try:
+        compiler = StreamCompiler(fmt)
+        digest = hashlib.sha1(fmt.encode())
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        async for chunk in request.stream():
+            digest.update(chunk)
+            compiler.feed(decoder.decode(chunk))
+        compiler.feed(decoder.decode(b"", final=True))
+        timetable = compiler.close()
+    except (TimetableError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    timetable_id = digest.hexdigest()[:16]
+    put_timetable(timetable_id, timetable)
+    return {
+        "timetable_id": timetable_id,
+        "trains": len(timetable),
+        "passenger_trains": timetable.num_passenger,
+        "freight_trains": len(timetable) - timetable.num_passenger,
+        "compiled_bytes": timetable.nbytes
+    }
+
+
+# ----------------------------------------------------------
+# WINDOWED / FILTERED / PAGINATED TRAJECTORIES
+# ----------------------------------------------------------
+@app.get("/simulate/trains")
+def simulate_trains(
+    run_id: str = "",
+    auto_blocks: str = "",
+    loops: str = "",
+    speed_up: str = "",
+    timetable_id: str = "",
+    t_start: float = None,
+    t_end: float = None,
+    direction: str = "",
+    train_type: str = "",
+    station_from: str = "",
+    station_to: str = "",
+    cursor: str = "",
+    limit: int = 100
+):
+    """
+    Query Example:
+    /simulate/trains?run_id=<id from /simulate>&t_start=6&t_end=9&direction=UP&train_type=Freight&limit=50
+    /simulate/trains?loops=10,13&station_from=VZM&station_to=DUSI&cursor=<next_cursor>
+
+    Returns only trains overlapping the time window (hours) that match the
+    filters, ordered by start time, one page at a time.
+    """
+    run = resolve_run(run_id, auto_blocks, loops, speed_up, timetable_id)
+
+    try:
+        lo = parse_station(station_from)
+        hi = parse_station(station_to)
+        if lo is not None and hi is not None and lo > hi:
+            lo, hi = hi, lo
+        with _corridor_lock.shared():
+            trains, next_cursor, total = run.index.query(
+                t_start=t_start, t_end=t_end,
+                direction=direction or None, train_type=train_type or None,
+                station_lo=lo, station_hi=hi,
+                cursor=cursor or None, limit=max(1, min(limit, 1000))
+            )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return {
+        "run_id": run.run_id,
+        "total": total,
+        "count": len(trains),
+        "next_cursor": next_cursor,
+        "trains": trains
+    }
+
+
+# ----------------------------------------------------------
+# SERVER-SIDE DISTANCE-TIME CHART
+# ----------------------------------------------------------
+CHART_MEDIA_TYPES = {"png": "image/png", "svg": "image/svg+xml"}
+
+
+@app.get("/simulate/chart.{fmt}")
+def simulate_chart(
+    fmt: str,
+    run_id: str = "",
+    auto_blocks: str = "",
+    loops: str = "",
+    speed_up: str = "",
+    timetable_id: str = "",
+    t_start: float = None,
+    t_end: float = None
+):
+    """
+    Query Example:
+    /simulate/chart.png?run_id=<id>&t_start=0&t_end=12
+    /simulate/chart.svg?loops=10,13
+    """
+    if fmt not in CHART_MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail="fmt must be png or svg")
+
+    run = resolve_run(run_id, auto_blocks, loops, speed_up, timetable_id)
+    key = (fmt, t_start, t_end)
+    img = run.charts.get(key)
+    if img is None:
+        title = (
+            "Distance–Time Chart\n"
+            f"Runtime: {run.response['simulation_time_hours']:.2f}h"
+        )
+        with _corridor_lock.shared():
+            img = render_distance_time(run.trajectories, fmt=fmt, title=title,
+                                       t_start=t_start, t_end=t_end)
+        run.charts.put(key, img)
+
+    return Response(content=img, media_type=CHART_MEDIA_TYPES[fmt])
+
+
+# ----------------------------------------------------------
+# LEVEL-OF-DETAIL TRAJECTORY TILES
+# ----------------------------------------------------------
+@app.get("/simulate/tiles/{zoom}/{x}")
+def simulate_tile(
+    zoom: int,
+    x: int,
+    run_id: str = "",
+    auto_blocks: str = "",
+    loops: str = "",
+    speed_up: str = "",
+    timetable_id: str = ""
+):
+    """
+    Query Example:
+    /simulate/tiles/0/0?run_id=<id>      (whole day, decimated / aggregated)
+    /simulate/tiles/3/2?run_id=<id>      (hours 8-12 at full detail)
+    """
+    run = resolve_run(run_id, auto_blocks, loops, speed_up, timetable_id)
+    tile = run.tiles.get((zoom, x))
+    if tile is None:
+        try:
+            with _corridor_lock.shared():
+                tile = build_tile(run.trajectories, zoom, x)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        tile["run_id"] = run.run_id
+        run.tiles.put((zoom, x), tile)
+    return tile
+
+
+# ----------------------------------------------------------
+# BASELINE VS SCENARIO COMPARISON
+# ----------------------------------------------------------
+@app.get("/compare")
+def compare(
+    base_run_id: str = "",
+    base_auto_blocks: str = "",
+    base_loops: str = "",
+    base_speed_up: str = "",
+    base_timetable_id: str = "",
+    run_id: str = "",
+    auto_blocks: str = "",
+    loops: str = "",
+    speed_up: str = "",
+    timetable_id: str = "",
+    top: int = 5
+):
+    """
+    Query Example:
+    /compare?loops=10,13&speed_up=17:1.5                (vs. the plain baseline)
+    /compare?base_run_id=<id>&run_id=<id>&top=10
+    /compare?timetable_id=<id>&loops=10                  (vs. that timetable on plain infra)
+
+    Per-train arrival / dwell / per-block time deltas (scenario - baseline),
+    their distributions, and the blocks whose delay moved the most.
+    The baseline defaults to the unmodified infrastructure running the
+    scenario's own timetable (synthetic or loaded), and is cached like any run.
+    Train ids only identify the same train within one timetable, so runs
+    of different timetables are not compared.
+    """
+    scen = resolve_run(run_id, auto_blocks, loops, speed_up, timetable_id)
+    scen_tt = scen.response.get("timetable_id") or ""
+    base = resolve_run(base_run_id, base_auto_blocks, base_loops, base_speed_up,
+                       base_timetable_id or scen_tt)
+    if (base.response.get("timetable_id") or "") != scen_tt:
+        raise HTTPException(status_code=400, detail="baseline and scenario use different timetables")
+
+    with _corridor_lock.shared():
+        result = compare_runs(base.train_times, scen.train_times, top=max(1, min(top, NUM_BLOCKS)))
+    return {
+        "baseline_run_id": base.run_id,
+        "scenario_run_id": scen.run_id,
+        "simulation_time_delta_hours": round(
+            scen.response["simulation_time_hours"] - base.response["simulation_time_hours"], 2
+        ),
+        **result
+    }
+
+
+# ----------------------------------------------------------
+# MONTE CARLO REPLICATIONS
+# ----------------------------------------------------------
+@app.get("/simulate/replicate")
+def simulate_replicate(
+    auto_blocks: str = "",
+    loops: str = "",
+    speed_up: str = "",
+    reps: int = 10,
+    max_reps: int = 0,
+    rel_precision: float = None,
+    workers: int = 0,
+    timetable_id: str = "",
+    departure_delay_min: float = 0.0
+):
+    """
+    Query Example:
+    /simulate/replicate?loops=10,13&reps=20
+    /simulate/replicate?speed_up=17:1.5&reps=8&max_reps=64&rel_precision=0.005
+    /simulate/replicate?timetable_id=<id from POST /timetables>&departure_delay_min=5&loops=10&reps=4
+
+    Runs baseline and scenario with the same seeds (common random numbers)
+    and returns means, 95% confidence intervals and the paired
+    scenario - baseline differences. A loaded timetable is deterministic,
+    so with timetable_id the seed drives exponential departure delays of
+    mean departure_delay_min minutes, which must be > 0.
+    """
+    if not 2 <= reps <= MAX_REPLICATIONS or max_reps > MAX_REPLICATIONS:
+        raise HTTPException(status_code=400, detail=f"reps must be 2..{MAX_REPLICATIONS}")
+    if rel_precision is not None and not (math.isfinite(rel_precision) and rel_precision > 0):
+        raise HTTPException(status_code=400, detail="rel_precision must be a positive number")
+    if workers < 0:
+        raise HTTPException(status_code=400, detail="workers must be >= 0 (0 = one per CPU)")
+    # one interpreter per worker: never more than the host has CPUs
+    cpus = os.cpu_count() or 1
+    workers = min(workers or cpus, cpus)
+
+    timetable = None
+    if timetable_id:
+        timetable = get_timetable(timetable_id)
+        if timetable is None:
+            raise HTTPException(status_code=404, detail=f"Unknown or expired timetable_id {timetable_id}")
+        if not (math.isfinite(departure_delay_min) and departure_delay_min > 0):
+            raise HTTPException(status_code=400,
+                                detail="timetable_id needs departure_delay_min > 0: a timetable run does not depend on the seed")
+
+    scenario = {"id": "scenario"}
+    auto_blocks_list = parse_auto_blocks(auto_blocks)
+    loops_list = parse_loops(loops)
+    speed_dict = parse_speed_up(speed_up)
+    if auto_blocks_list:
+        scenario["auto_blocks"] = auto_blocks_list
+    if loops_list:
+        scenario["loop_stations"] = loops_list
+    if speed_dict:
+        scenario["speed_up_blocks"] = speed_dict
+
+    out = replicate([{"id": "baseline"}, scenario], reps=reps, max_reps=max_reps or None,
+                    rel_precision=rel_precision, workers=workers, timetable=timetable,
+                    mean_departure_delay=departure_delay_min / 60 if timetable is not None else 0.0)
+
+    def rounded(ci):
+        return {k: (round(v, 4) if isinstance(v, float) else v) for k, v in ci.items()}
+
+    return {
+        "replications": len(out["seeds"]),
+        "converged": out["converged"],
+        "timetable_id": timetable_id or None,
+        "departure_delay_min": departure_delay_min if timetable is not None else None,
         "infrastructure": {
             "auto_blocks": auto_blocks_list,
             "loop_stations": loops_list,
             "speed_up_blocks": speed_dict
         },
-        "freight_stats": {
-            "finished_trains": int(freight_finished),
-            "average_travel_time_hours": round(avg_frt_time, 2) if freight_finished > 0 else 0.0,
-            "average_speed_kmph": round(avg_frt_speed, 1) if freight_finished > 0 else 0.0
-        },
-        "trains": format_train_segments(df)
+        "scenarios": {
+            sid: {part: {m: rounded(ci) for m, ci in cis.items()} for part, cis in res.items()}
+            for sid, res in out["scenarios"].items()
+        }
     }
 
-    return response
+
+# ----------------------------------------------------------
+# METRICS
+# ----------------------------------------------------------
+@app.get("/metrics")
+def get_metrics():
+    """Simulation counters since startup (completed, cache hits, cancellations)."""
+    return {
+        "simulations": {
+            "completed": metrics["simulations.completed"],
+            "cache_hits": metrics["simulations.cache_hits"],
+            "cancelled": {
+                reason: metrics[f"simulations.cancelled.{reason}"]
+                for reason in ("disconnected", "superseded")
+            }
+        }
+    }
@@ -0,0 +1,164 @@
+import json
+import threading
+
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session, object_session
+
+from app.db import SessionLocal
+from app.models.infra import Block
+
+# --------------------------------------------------------
+# BLOCK SNAPSHOT
+# --------------------------------------------------------
+# Blocks are read once as plain column tuples (no ORM objects) and every
+# /infra response is pre-serialized from that snapshot. A committed write
+# to the blocks table drops the snapshot; the next read rebuilds it.
+
+BLOCK_COLUMNS = (Block.id, Block.station_from, Block.station_to, Block.distance_km)
+
+
+class InfraSnapshot:
+    __slots__ = ("rows", "block_lengths", "infra_json", "sympy_json")
+
+    def __init__(self, rows):
+        self.rows = tuple(tuple(r) for r in rows)
+        # ordered by block id -> same layout as sim.CORRIDOR_BLOCK_LENGTHS
+        self.block_lengths = tuple(float(r[3]) for r in self.rows)
+
+        blocks = [
+            {"id": i, "station_from": f, "station_to": t, "distance_km": d}
+            for i, f, t, d in self.rows
+        ]
+        self.infra_json = json.dumps(blocks).encode()
+        self.sympy_json = json.dumps({
+            "BLOCKS": [
+                {"id": i, "from": f, "to": t, "distance": d}
+                for i, f, t, d in self.rows
+            ],
+            "num_blocks": len(self.rows)
+        }).encode()
+
+
+_lock = threading.Lock()
+_snapshot = None
+_version = 0
+
+
+def fetch_block_rows(db):
+    """Bulk, column-only read of the blocks table."""
+    return db.execute(select(*BLOCK_COLUMNS).order_by(Block.id)).all()
+
+
+async def fetch_block_rows_async(db):
+    result = await db.execute(select(*BLOCK_COLUMNS).order_by(Block.id))
+    return result.all()
+
+
+def get_snapshot(db=None):
+    """
+    Read-through: return the cached snapshot or build it from `db`
+    (a new pooled session is opened if none is given).
+    """
+    global _snapshot
+    if db is not None and db.info.get(DIRTY_KEY):
+        # this session sees its own uncommitted block writes: don't cache them
+        return InfraSnapshot(fetch_block_rows(db))
+
+    snap = _snapshot
+    if snap is not None:
+        return snap
+
+    with _lock:
+        if _snapshot is not None:
+            return _snapshot
+        version = _version
+        if db is None:
+            with SessionLocal() as own:
+                rows = fetch_block_rows(own)
+        else:
+            rows = fetch_block_rows(db)
+        snap = InfraSnapshot(rows)
+        # a write that landed while we were reading makes this snapshot stale
+        if version == _version:
+            _snapshot = snap
+        return snap
+
+
+async def get_snapshot_async(db):
+    global _snapshot
+    if db.sync_session.info.get(DIRTY_KEY):
+        return InfraSnapshot(await fetch_block_rows_async(db))
+
+    snap = _snapshot
+    if snap is not None:
+        return snap
+    version = _version
+    snap = InfraSnapshot(await fetch_block_rows_async(db))
+    with _lock:
+        if version == _version and _snapshot is None:
+            _snapshot = snap
+    return snap
+
+
+def invalidate():
+    """Drop the snapshot; needed after block writes that bypass the ORM Session."""
+    global _snapshot, _version
+    with _lock:
+        _snapshot = None
+        _version += 1
+
+
+def block_lengths():
+    """
+    Cached per-block distances (km) in block-id order, for the simulator.
+    No DB round-trip once the snapshot is warm.
+    """
+    return get_snapshot().block_lengths
+
+
+# --------------------------------------------------------
+# INVALIDATION ON WRITES
+# --------------------------------------------------------
+# Writes only mark their session at flush time; the snapshot is dropped
+# once the transaction commits. Dropping it at flush would let a read
+# between flush and commit re-cache the old committed rows for good.
+#
+# Only writes made through an ORM Session (sync or async) in this process
+# are seen. Core writes (engine.begin() / connection.execute) and writes by
+# other processes bypass these events: call invalidate() after them, or the
+# snapshot keeps serving the old rows.
+DIRTY_KEY = "infra_blocks_dirty"
+
+
+def _mark_dirty(session):
+    if session is not None:
+        session.info[DIRTY_KEY] = True
+
+
+def _on_block_write(mapper, connection, target):
+    _mark_dirty(object_session(target))
+
+
+for _evt in ("after_insert", "after_update", "after_delete"):
+    event.listen(Block, _evt, _on_block_write)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _on_bulk_write(orm_execute_state):
+    # bulk INSERT / UPDATE / DELETE statements bypass the mapper events above
+    st = orm_execute_state
+    if st.is_insert or st.is_update or st.is_delete:
+        if st.bind_mapper is not None and st.bind_mapper.class_ is Block:
+            _mark_dirty(st.session)
+
+
+@event.listens_for(Session, "after_commit")
+def _on_commit(session):
+    if session.info.pop(DIRTY_KEY, False):
+        invalidate()
+
+
+@event.listens_for(Session, "after_rollback")
+def _on_rollback(session):
+    # nothing reached the table; the snapshot never saw the rolled-back rows
+    session.info.pop(DIRTY_KEY, None)
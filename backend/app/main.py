@@ -1,6 +1,16 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
+from app.db import init_db
 from app.routers.infra_router import router as infra_router
 
-app = FastAPI()
-print(fastapi.__version__)
+
+@asynccontextmanager
+async def lifespan(app):
+    # creates missing tables (e.g. a fresh local SQLite file); existing ones are left alone
+    init_db()
+    yield
+
+
+app = FastAPI(lifespan=lifespan)
 app.include_router(infra_router)
@@ -1,8 +1,9 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Response
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from app.db import SessionLocal
-from app.models.infra import Block
+from app.db import SessionLocal, AsyncSessionLocal
+from app.infra_cache import get_snapshot, get_snapshot_async
 from app.schemas.infra_schema import BlockSchema
 
 router = APIRouter(prefix="/infra", tags=["Infra"])
@@ -15,34 +16,26 @@ def get_db():
         db.close()
 
 
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
 # --------------------------------------------------------
 # 1. GET Infra from Postgres
 # --------------------------------------------------------
 @router.get("/get", response_model=list[BlockSchema])
 def get_infra(db: Session = Depends(get_db)):
-    blocks = db.query(Block).all()
-    return blocks
+    # served pre-serialized from the cached block snapshot
+    return Response(content=get_snapshot(db).infra_json, media_type="application/json")
 
 
 # --------------------------------------------------------
 # 2. GET Infra formatted for SymPy solver
 # --------------------------------------------------------
 @router.get("/sympy-input")
-def get_infra_for_sympy(db: Session = Depends(get_db)):
-    blocks = db.query(Block).all()
-
-    # Convert to solver form
-    sympy_input = {
-        "BLOCKS": [
-            {
-                "id": b.id,
-                "from": b.station_from,
-                "to": b.station_to,
-                "distance": b.distance_km,
-            }
-            for b in blocks
-        ],
-        "num_blocks": len(blocks)
-    }
-
-    return sympy_input
+async def get_infra_for_sympy(db: AsyncSession = Depends(get_async_db)):
+    # {"BLOCKS": [{"id", "from", "to", "distance"}, ...], "num_blocks": N}
+    # async session: a cold snapshot is read without holding a threadpool worker
+    snap = await get_snapshot_async(db)
+    return Response(content=snap.sympy_json, media_type="application/json")
@@ -0,0 +1,110 @@
+"""
+Baseline-vs-scenario comparison on per-train timing arrays.
+
+Every train logs its position in a fixed pattern:
+    arrive/depart origin, then for each block: leave station, arrive next station
+so within a train (rows sorted by time) odd rows are "leave station" and
+even rows are "arrive station". From that, per train:
+    dwell      = sum(leave - arrive) over stations   (dwell + station wait)
+    block time = arrive(next) - leave(station)       (block wait + run time)
+"""
+import numpy as np
+
+from sim import station_pos, NUM_BLOCKS, STATION_CODES
+
+PERCENTILES = (5, 25, 50, 75, 95)
+
+
+class TrainTimes:
+    """Per-train arrival, dwell and per-block times of one run, as aligned arrays."""
+
+    def __init__(self, traj):
+        n = len(traj)
+        self.train_ids = traj.train_ids
+        self.departure = traj.time[traj.offsets[:-1]]
+        self.arrival = traj.time[traj.offsets[1:] - 1]
+        self.block_time = np.full((n, NUM_BLOCKS), np.nan)
+
+        owner = traj.train_of_row
+        local = np.arange(len(traj.time)) - traj.offsets[owner]
+        pos = np.asarray(station_pos)
+        mids = (pos[1:] + pos[:-1]) / 2
+        st = np.searchsorted(mids, traj.dist)
+
+        # dwell: every leave row (odd local index) minus the arrival row before it
+        leave = np.flatnonzero(local % 2 == 1)
+        arrive_before = leave - 1
+        self.dwell = np.bincount(owner[leave], weights=traj.time[leave] - traj.time[arrive_before],
+                                 minlength=n)
+
+        # block: leave row -> next row (arrival), only when it belongs to the same train
+        nxt = leave + 1
+        ok = nxt < len(traj.time)
+        leave, nxt = leave[ok], nxt[ok]
+        ok = owner[nxt] == owner[leave]
+        leave, nxt = leave[ok], nxt[ok]
+        blk = np.minimum(st[leave], st[nxt])
+        self.block_time[owner[leave], blk] = traj.time[nxt] - traj.time[leave]
+
+
+def _distribution(values):
+    if len(values) == 0:
+        return {"mean": 0.0, **{f"p{p}": 0.0 for p in PERCENTILES}}
+    qs = np.percentile(values, PERCENTILES)
+    out = {"mean": round(float(values.mean()), 4)}
+    out.update({f"p{p}": round(float(q), 4) for p, q in zip(PERCENTILES, qs)})
+    return out
+
+
+def compare_runs(base, scen, top=5):
+    """
+    base / scen: TrainTimes of the baseline and scenario runs.
+    Trains are matched by train id; trains present in only one run
+    (e.g. freights that finish in one but not the other) are listed apart.
+    """
+    common, bi, si = np.intersect1d(base.train_ids, scen.train_ids,
+                                    assume_unique=True, return_indices=True)
+
+    d_arr = scen.arrival[si] - base.arrival[bi]
+    d_dwell = scen.dwell[si] - base.dwell[bi]
+    d_blk = scen.block_time[si] - base.block_time[bi]   # nan where not run in both
+
+    trains = []
+    for k, tid in enumerate(common):
+        row = d_blk[k]
+        # only blocks whose time moved by at least the reported precision
+        moved = np.flatnonzero(np.abs(np.nan_to_num(row)) >= 5e-5)
+        trains.append({
+            "train_id": f"T{int(tid)}",
+            "arrival_delta_hours": round(float(d_arr[k]), 4),
+            "dwell_delta_hours": round(float(d_dwell[k]), 4),
+            "block_delta_hours": {int(b): round(float(row[b]), 4) for b in moved},
+        })
+
+    used = ~np.isnan(d_blk)
+    blk_total = np.nansum(d_blk, axis=0)
+    blk_count = used.sum(axis=0)
+    order = np.argsort(-np.abs(blk_total), kind="stable")[:top]
+    top_blocks = [
+        {
+            "block": int(b),
+            "from_station": STATION_CODES[b],
+            "to_station": STATION_CODES[b + 1],
+            "total_delta_hours": round(float(blk_total[b]), 4),
+            "mean_delta_hours": round(float(blk_total[b] / blk_count[b]), 4) if blk_count[b] else 0.0,
+            "trains": int(blk_count[b]),
+        }
+        for b in order if blk_total[b] != 0
+    ]
+
+    return {
+        "matched_trains": int(len(common)),
+        "only_in_baseline": [f"T{int(t)}" for t in np.setdiff1d(base.train_ids, common)],
+        "only_in_scenario": [f"T{int(t)}" for t in np.setdiff1d(scen.train_ids, common)],
+        "distribution": {
+            "arrival_delta_hours": _distribution(d_arr),
+            "dwell_delta_hours": _distribution(d_dwell),
+        },
+        "top_blocks": top_blocks,
+        "trains": trains,
+    }
@@ -0,0 +1,174 @@
+"""
+Distance-time charts, for the CLI and for server-side rendering.
+
+Trajectories are turned into flat columns once (Trajectories) and every
+chart is drawn as a single LineCollection, whatever the number of trains.
+matplotlib is only imported when a chart is actually drawn, so the API
+never pays for it at startup.
+"""
+import io
+
+import numpy as np
+
+from sim import station_pos, STATION_CODES, UP_TRAINS, DOWN_TRAINS
+
+CLASS_COLORS = {
+    ("UP", False): "#005eff",      # UP Passenger
+    ("DOWN", False): "#ff3300",    # DOWN Passenger
+    ("UP", True): "#00aa00",       # UP Freight
+    ("DOWN", True): "#ff8800",     # DOWN Freight
+}
+
+
+# ===================== COLUMNAR TRAJECTORIES =====================
+
+class Trajectories:
+    """
+    All train trajectories of one run as flat arrays sorted by (train, time).
+
+    Train k owns rows offsets[k]:offsets[k + 1] of `time` / `dist`
+    (dist is the absolute corridor position in km).
+    """
+
+    def __init__(self, df, passenger_cutoff=None):
+        if passenger_cutoff is None:
+            passenger_cutoff = UP_TRAINS + DOWN_TRAINS
+
+        ids = df.train.to_numpy()
+        order = np.lexsort((df.time.to_numpy(), ids))
+        ids = ids[order]
+        signed = df.dist.to_numpy()[order]
+
+        self.time = df.time.to_numpy()[order]
+        self.dist = np.abs(signed)
+
+        self.train_ids, first = np.unique(ids, return_index=True)
+        self.offsets = np.append(first, len(ids))
+        self.train_of_row = np.repeat(np.arange(len(self.train_ids)), np.diff(self.offsets))
+
+        self.is_up = signed[first] >= 0
+        self.is_freight = self.train_ids >= passenger_cutoff
+        self.colors = np.array([
+            CLASS_COLORS[("UP" if up else "DOWN", bool(frt))]
+            for up, frt in zip(self.is_up, self.is_freight)
+        ])
+
+        self.t_min = float(self.time.min()) if len(self.time) else 0.0
+        self.t_max = float(self.time.max()) if len(self.time) else 0.0
+
+    def __len__(self):
+        return len(self.train_ids)
+
+    def lines(self, rows=None):
+        """(N_i, 2) vertex arrays per train, optionally restricted to a row mask."""
+        pts = np.column_stack((self.time, self.dist))
+        if rows is None:
+            return np.split(pts, self.offsets[1:-1])
+        keep = np.flatnonzero(rows)
+        cuts = np.flatnonzero(np.diff(self.train_of_row[keep])) + 1
+        return np.split(pts[keep], cuts)
+
+
+# ===================== DRAWING =====================
+
+def _new_figure(figsize):
+    from matplotlib.figure import Figure
+
+    # plain Figure (no pyplot state) -> safe to use from API worker threads
+    return Figure(figsize=figsize)
+
+
+def draw_trajectories(ax, lines, colors, linewidth=1.1, alpha=0.9):
+    """All trains in one LineCollection (one artist, one draw call)."""
+    from matplotlib.collections import LineCollection
+
+    ax.add_collection(LineCollection(lines, colors=colors, linewidths=linewidth, alpha=alpha))
+
+
+def _style_axes(ax, title, t_range, fontsize=8):
+    ax.set_yticks(station_pos, STATION_CODES, fontsize=fontsize)
+    ax.grid(True, linestyle="--", alpha=0.3)
+    ax.set_xlabel("Time (hours)")
+    ax.set_ylabel("Distance (km)")
+    ax.set_title(title)
+    ax.set_xlim(*t_range)
+    ax.set_ylim(0, max(station_pos) + 5)
+
+
+def _add_legend(ax):
+    from matplotlib.lines import Line2D
+
+    legend_elements = [
+        Line2D([0], [0], color=CLASS_COLORS[("UP", False)], lw=2, label="UP Passenger"),
+        Line2D([0], [0], color=CLASS_COLORS[("DOWN", False)], lw=2, label="DOWN Passenger"),
+        Line2D([0], [0], color=CLASS_COLORS[("UP", True)], lw=2, label="UP Freight"),
+        Line2D([0], [0], color=CLASS_COLORS[("DOWN", True)], lw=2, label="DOWN Freight"),
+    ]
+    ax.legend(handles=legend_elements, loc="upper right")
+
+
+def render_distance_time(traj, fmt="png", title="Distance–Time Chart",
+                         t_start=None, t_end=None, figsize=(15, 9), dpi=100):
+    """
+    Render a run's distance-time chart to PNG/SVG bytes.
+    t_start / t_end (hours) crop the time axis; trains outside it are skipped.
+    """
+    t0 = traj.t_min if t_start is None else t_start
+    t1 = traj.t_max if t_end is None else t_end
+
+    # whole trains outside the window are dropped before drawing
+    starts = traj.time[traj.offsets[:-1]]
+    ends = traj.time[traj.offsets[1:] - 1]
+    visible = (starts <= t1) & (ends >= t0)
+    lines = [ln for ln, v in zip(traj.lines(), visible) if v]
+
+    fig = _new_figure(figsize)
+    ax = fig.add_subplot()
+    draw_trajectories(ax, lines, traj.colors[visible])
+    _style_axes(ax, title, (t0, t1))
+    _add_legend(ax)
+    fig.tight_layout()
+
+    buf = io.BytesIO()
+    fig.savefig(buf, format=fmt, dpi=dpi)
+    return buf.getvalue()
+
+
+# ===================== CLI CHARTS =====================
+
+def plot_baseline_vs_scenario(df_base, df_scen, scenario_label, imp, path="baseline_vs_scenario.png"):
+    base = Trajectories(df_base)
+    scen = Trajectories(df_scen)
+
+    # Distance–time plot (uses raw station positions but we could change to STATION_CODES labels)
+    fig = _new_figure((14, 8))
+    ax = fig.add_subplot()
+    draw_trajectories(ax, base.lines(), "gray", linewidth=0.7, alpha=0.30)
+
+    # scenario colored by direction of its first logged position
+    first = scen.offsets[:-1]
+    signed_up = (scen.dist[first] > 0) & scen.is_up
+    draw_trajectories(ax, scen.lines(), np.where(signed_up, "blue", "red"), linewidth=1.8, alpha=1.0)
+
+    ax.grid(True)
+    ax.set_title(
+        f"Baseline vs {scenario_label} Scenario\n"
+        f"Impr: +{imp:.2f}h"
+    )
+    ax.set_xlabel("Time (hours)")
+    ax.set_ylabel("Distance (km)")
+    ax.set_yticks(station_pos, STATION_CODES)
+    ax.set_xlim(min(base.t_min, scen.t_min), max(base.t_max, scen.t_max))
+    ax.set_ylim(0, max(station_pos) + 5)
+    fig.tight_layout()
+    fig.savefig(path)
+
+
+def plot_full_timetable(df_scen, scenario_label, T_scen, path="full_timetable_classified_dt_chart.png"):
+    traj = Trajectories(df_scen)
+    title = (
+        "Full Distance–Time Timetable Chart\n"
+        f"{scenario_label} Scenario Runtime: {T_scen:.2f}h"
+    )
+    with open(path, "wb") as f:
+        f.write(render_distance_time(traj, fmt=path.rsplit(".", 1)[-1], title=title))
@@ -0,0 +1,194 @@
+"""
+Monte Carlo replications of run_sim scenarios.
+
+Each scenario is run with K seeds in parallel worker processes. All
+scenarios share the same seed list (common random numbers), so a
+scenario's difference to the first (reference) scenario is estimated
+from paired runs, which is much tighter than comparing two independent
+means. Replications can stop adaptively once every confidence interval
+is narrower than a target relative precision.
+
+Usage:
+    python replication.py --reps 20 --loops 10,13
+    python replication.py --reps 10 --max-reps 100 --rel-precision 0.005 --workers 4
+    python replication.py --reps 4 --loops 10 --trajectories-dir traj/
+"""
+import argparse
+import math
+import os
+from shared import SharedRunner
+
+METRICS = ("simulation_time", "freight_finished", "avg_freight_speed")
+BASE_SEED = 42
+
+# two-sided 95% Student t quantiles by degrees of freedom
+_T95 = {
+    1: 12.706, 2: 4.303, 3: 3.182, 4: 2.776, 5: 2.571, 6: 2.447, 7: 2.365, 8: 2.306,
+    9: 2.262, 10: 2.228, 11: 2.201, 12: 2.179, 13: 2.160, 14: 2.145, 15: 2.131,
+    16: 2.120, 17: 2.110, 18: 2.101, 19: 2.093, 20: 2.086, 21: 2.080, 22: 2.074,
+    23: 2.069, 24: 2.064, 25: 2.060, 26: 2.056, 27: 2.052, 28: 2.048, 29: 2.045,
+    30: 2.042, 40: 2.021, 60: 2.000, 120: 1.980,
+}
+
+
+def t95(df):
+    """Quantile of the largest tabulated df <= df: slightly wide, never narrow."""
+    if df in _T95:
+        return _T95[df]
+    if df > 120:
+        return _T95[120]
+    return _T95[max(k for k in _T95 if k < df)]
+
+
+def confidence_interval(values):
+    """Mean and 95% t-interval of a sample."""
+    n = len(values)
+    mean = sum(values) / n
+    if n < 2:
+        return {"n": n, "mean": mean, "std": 0.0, "half_width": math.inf,
+                "ci_low": -math.inf, "ci_high": math.inf}
+    std = math.sqrt(sum((v - mean) ** 2 for v in values) / (n - 1))
+    hw = t95(n - 1) * std / math.sqrt(n)
+    return {"n": n, "mean": mean, "std": std, "half_width": hw,
+            "ci_low": mean - hw, "ci_high": mean + hw}
+
+
+def _narrow_enough(ci, rel_precision):
+    return ci["half_width"] <= rel_precision * max(abs(ci["mean"]), 1e-9)
+
+
+def replicate(scenarios, reps=10, max_reps=None, rel_precision=None, workers=None,
+              base_seed=BASE_SEED, timetable=None, mean_departure_delay=0.0, trajectories=False):
+    """
+    scenarios: list of run_sim kwargs dicts with a unique "id"; the first one
+               is the reference for the paired differences.
+    reps:      replications per scenario (first batch when adaptive)
+    max_reps / rel_precision: keep adding batches of `reps` seeds until every
+               metric's CI half-width is <= rel_precision * |mean| or max_reps is hit
+    timetable: optional compiled Timetable, published once to the workers
+               through shared memory. A timetable run only varies with the
+               seed through its departure delays, so it needs
+               mean_departure_delay > 0 (hours, see run_sim).
+    trajectories: also return each run's (train, time, dist) frame; workers
+               write them into the runner's shared buffers, not back
+               through the pipe.
+
+    Returns {"seeds", "converged", "scenarios": {id: {"metrics", "vs_reference"}}},
+    plus "trajectories": {id: {seed: DataFrame}} when asked for.
+    """
+    if reps < 2:
+        raise ValueError("reps must be >= 2 for a confidence interval")
+    if rel_precision is not None and not (math.isfinite(rel_precision) and rel_precision > 0):
+        raise ValueError("rel_precision must be a positive number")
+    if timetable is not None and not mean_departure_delay > 0:
+        raise ValueError("a timetable is deterministic: replicate it with mean_departure_delay > 0")
+    max_reps = max(reps, max_reps or reps)
+    workers = workers or os.cpu_count() or 1
+
+    if mean_departure_delay > 0:
+        scenarios = [dict(s, mean_departure_delay=mean_departure_delay) for s in scenarios]
+
+    samples = {s["id"]: {m: [] for m in METRICS} for s in scenarios}
+    frames = {s["id"]: {} for s in scenarios} if trajectories else None
+    seeds = []
+    converged = False
+
+    with SharedRunner(workers=workers, timetable=timetable, trajectories=trajectories) as runner:
+        while len(seeds) < max_reps:
+            batch = [base_seed + i for i in range(len(seeds), min(len(seeds) + reps, max_reps))]
+            jobs = [(s, seed) for seed in batch for s in scenarios]
+            # same seed for every scenario -> common random numbers
+            results = runner.map([dict(s, seed=seed) for s, seed in jobs])
+            for slot, ((s, seed), kpis) in enumerate(zip(jobs, results)):
+                for m in METRICS:
+                    samples[s["id"]][m].append(kpis[m])
+                if trajectories:
+                    frames[s["id"]][seed] = runner.frame(slot)
+            seeds += batch
+
+            summary = _summarize(scenarios, samples)
+            if rel_precision is None:
+                break
+            converged = all(
+                _narrow_enough(ci, rel_precision)
+                for res in summary.values() for ci in res["metrics"].values()
+            )
+            if converged:
+                break
+
+    out = {"seeds": seeds, "converged": converged, "scenarios": summary}
+    if trajectories:
+        out["trajectories"] = frames
+    return out
+
+
+def _summarize(scenarios, samples):
+    ref = scenarios[0]["id"]
+    out = {}
+    for s in scenarios:
+        sid = s["id"]
+        res = {"metrics": {m: confidence_interval(samples[sid][m]) for m in METRICS}}
+        if sid != ref:
+            res["vs_reference"] = {
+                m: confidence_interval([a - b for a, b in zip(samples[sid][m], samples[ref][m])])
+                for m in METRICS
+            }
+        out[sid] = res
+    return out
+
+
+# ===================== CLI =====================
+
+def _int_list(text):
+    return [int(x) for x in text.split(",") if x.strip().isdigit()] if text else None
+
+
+def _speed_dict(text):
+    if not text:
+        return None
+    return {int(b): float(m) for b, m in (item.split(":") for item in text.split(",") if ":" in item)}
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Monte Carlo replications: baseline vs scenario")
+    ap.add_argument("--reps", type=int, default=10)
+    ap.add_argument("--max-reps", type=int)
+    ap.add_argument("--rel-precision", type=float, help="e.g. 0.01 = CI half-width within 1%% of the mean")
+    ap.add_argument("--workers", type=int)
+    ap.add_argument("--auto-blocks")
+    ap.add_argument("--loops")
+    ap.add_argument("--speed-up", help="block:multiplier,... e.g. 17:1.5,18:1.2")
+    ap.add_argument("--trajectories-dir", help="write every run's trajectory to <dir>/<scenario>_seed<seed>.csv")
+    args = ap.parse_args(argv)
+
+    scenario = {"id": "scenario"}
+    if args.auto_blocks:
+        scenario["auto_blocks"] = _int_list(args.auto_blocks)
+    if args.loops:
+        scenario["loop_stations"] = _int_list(args.loops)
+    if args.speed_up:
+        scenario["speed_up_blocks"] = _speed_dict(args.speed_up)
+
+    out = replicate([{"id": "baseline"}, scenario], reps=args.reps, max_reps=args.max_reps,
+                    rel_precision=args.rel_precision, workers=args.workers,
+                    trajectories=bool(args.trajectories_dir))
+
+    if args.trajectories_dir:
+        os.makedirs(args.trajectories_dir, exist_ok=True)
+        for sid, by_seed in out["trajectories"].items():
+            for seed, df in by_seed.items():
+                df.to_csv(os.path.join(args.trajectories_dir, f"{sid}_seed{seed}.csv"), index=False)
+        print(f"💾 Trajectories written to {args.trajectories_dir}")
+
+    print(f"\n🎲 {len(out['seeds'])} replications per scenario"
+          + (f" (converged: {out['converged']})" if args.rel_precision else ""))
+    for sid, res in out["scenarios"].items():
+        print(f"\n===== {sid.upper()} =====")
+        for m, ci in res["metrics"].items():
+            print(f"{m:>20}: {ci['mean']:.3f}  [{ci['ci_low']:.3f}, {ci['ci_high']:.3f}]")
+        for m, ci in res.get("vs_reference", {}).items():
+            print(f"{'Δ ' + m:>20}: {ci['mean']:+.3f}  [{ci['ci_low']:+.3f}, {ci['ci_high']:+.3f}]")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,341 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from sim import station_pos, STATION_CODES
+from plots import Trajectories
+from compare import TrainTimes
+
+# ===================== RUN STORE =====================
+# Finished /simulate runs, keyed by a hash of the scenario. The simulation
+# is deterministic (fixed seed), so a repeat request for the same scenario
+# (e.g. frontend polling) is served from here without re-running.
+
+RUN_CACHE_SIZE = 32
+# per-run caches of derived views; chart windows and tiles are client-chosen
+RUN_CHART_CACHE_SIZE = 8
+RUN_TILE_CACHE_SIZE = 128
+RUN_DELTA_CACHE_SIZE = 8
+
+_runs = OrderedDict()
+_runs_lock = threading.Lock()
+
+
+def scenario_key(auto_blocks=None, loops=None, speed_up=None, timetable_id=None):
+    canon = {
+        "auto_blocks": sorted(auto_blocks or []),
+        "loops": sorted(loops or []),
+        "speed_up": sorted((speed_up or {}).items()),
+    }
+    if timetable_id:
+        canon["timetable"] = timetable_id
+    return hashlib.sha1(json.dumps(canon).encode()).hexdigest()[:16]
+
+
+class LRUCache:
+    """Small thread-safe LRU map: get() refreshes a key, put() evicts the oldest."""
+
+    def __init__(self, size):
+        self.size = size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._items.get(key)
+            if value is not None:
+                self._items.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.size:
+                self._items.popitem(last=False)
+        return value
+
+    def __len__(self):
+        return len(self._items)
+
+
+def train_hash(train):
+    """Content hash of one formatted train (its own "hash" field excluded)."""
+    body = {k: v for k, v in train.items() if k != "hash"}
+    blob = json.dumps(body, sort_keys=True, separators=(",", ":")).encode()
+    return hashlib.blake2b(blob, digest_size=8).hexdigest()
+
+
+class Run:
+    """
+    One finished simulation: the raw frame, the /simulate payload and the
+    derived views (index, columnar trajectories, per-train timings,
+    rendered charts, tiles, deltas against other runs).
+    Derived views are cached here, so they live and expire with the run.
+    """
+
+    def __init__(self, run_id, df, response, passenger_cutoff=None):
+        self.run_id = run_id
+        self.df = df
+        self.response = response
+        self.passenger_cutoff = passenger_cutoff
+        self._index = None
+        self._trajectories = None
+        self._train_times = None
+        self.charts = LRUCache(RUN_CHART_CACHE_SIZE)
+        self.tiles = LRUCache(RUN_TILE_CACHE_SIZE)
+        self.deltas = LRUCache(RUN_DELTA_CACHE_SIZE)
+
+        # every train in the payload carries its content hash, so clients
+        # can keep trains across runs and ask only for what changed
+        for train in response["trains"]:
+            train["hash"] = train_hash(train)
+        self.train_hashes = {t["train_id"]: t["hash"] for t in response["trains"]}
+
+    @property
+    def index(self):
+        # built on first trajectory query, then reused for every page
+        if self._index is None:
+            self._index = TrainIndex(self.df, self.response["trains"])
+        return self._index
+
+    @property
+    def trajectories(self):
+        if self._trajectories is None:
+            self._trajectories = Trajectories(self.df, self.passenger_cutoff)
+        return self._trajectories
+
+    @property
+    def train_times(self):
+        if self._train_times is None:
+            self._train_times = TrainTimes(self.trajectories)
+        return self._train_times
+
+
+def _common_prefix(a, b):
+    k = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        k += 1
+    return k
+
+
+def delta_response(run, since):
+    """
+    The /simulate payload of `run` relative to the earlier run `since`:
+    every field except "trains", plus
+
+        "delta": {"since": <run_id>, "changed": [...], "added": [train ids],
+                  "removed": [train ids], "unchanged": n}
+
+    Each "changed" entry is a train whose hash differs (or that is new),
+    with "segments" cut to the part after the first `keep_segments`
+    segments it shares with its version in `since`.
+    """
+    cached = run.deltas.get(since.run_id)
+    if cached is not None:
+        return cached
+
+    old_hashes = since.train_hashes
+    old_trains = None
+    changed = []
+    for t in run.response["trains"]:
+        h = old_hashes.get(t["train_id"])
+        if h == t["hash"]:
+            continue
+        keep = 0
+        if h is not None:
+            if old_trains is None:
+                old_trains = {o["train_id"]: o for o in since.response["trains"]}
+            keep = _common_prefix(old_trains[t["train_id"]]["segments"], t["segments"])
+        changed.append(dict(t, keep_segments=keep, segments=t["segments"][keep:]))
+
+    out = {k: v for k, v in run.response.items() if k != "trains"}
+    out["delta"] = {
+        "since": since.run_id,
+        "changed": changed,
+        "added": [tid for tid in run.train_hashes if tid not in old_hashes],
+        "removed": [tid for tid in old_hashes if tid not in run.train_hashes],
+        "unchanged": len(run.train_hashes) - len(changed),
+    }
+    return run.deltas.put(since.run_id, out)
+
+
+def get_run(run_id):
+    with _runs_lock:
+        run = _runs.get(run_id)
+        if run is not None:
+            _runs.move_to_end(run_id)
+        return run
+
+
+def clear_runs():
+    with _runs_lock:
+        _runs.clear()
+
+
+def put_run(run):
+    with _runs_lock:
+        _runs[run.run_id] = run
+        _runs.move_to_end(run.run_id)
+        while len(_runs) > RUN_CACHE_SIZE:
+            _runs.popitem(last=False)
+    return run
+
+
+# ===================== TIMETABLE STORE =====================
+# Uploaded timetables, compiled once and referenced by content hash.
+
+TIMETABLE_CACHE_SIZE = 8
+
+_timetables = OrderedDict()
+
+
+def get_timetable(timetable_id):
+    with _runs_lock:
+        tt = _timetables.get(timetable_id)
+        if tt is not None:
+            _timetables.move_to_end(timetable_id)
+        return tt
+
+
+def put_timetable(timetable_id, timetable):
+    with _runs_lock:
+        _timetables[timetable_id] = timetable
+        _timetables.move_to_end(timetable_id)
+        while len(_timetables) > TIMETABLE_CACHE_SIZE:
+            _timetables.popitem(last=False)
+    return timetable
+
+
+# ===================== TRAJECTORY INDEX =====================
+
+class TrainIndex:
+    """
+    Per-run index over the formatted trains.
+
+    Trains are grouped by (direction, train_type) and each group is kept
+    sorted by (start time, train id), so a time-window query is a binary
+    search plus a vectorized mask instead of a rescan of the DataFrame.
+    """
+
+    def __init__(self, df, trains):
+        self.trains = trains
+        pos = np.asarray(station_pos)
+
+        ids = df.train.to_numpy()
+        times = df.time.to_numpy()
+        st = np.abs(np.abs(df.dist.to_numpy())[:, None] - pos[None, :]).argmin(axis=1)
+
+        order = np.argsort(ids, kind="stable")
+        ids, times, st = ids[order], times[order], st[order]
+        uniq, first = np.unique(ids, return_index=True)
+        t_min = np.minimum.reduceat(times, first)
+        t_max = np.maximum.reduceat(times, first)
+        st_min = np.minimum.reduceat(st, first)
+        st_max = np.maximum.reduceat(st, first)
+        row_of = {int(t): i for i, t in enumerate(uniq)}
+
+        groups = {}
+        for pos_in_list, tr in enumerate(trains):
+            key = (tr["direction"], tr["train_type"])
+            groups.setdefault(key, []).append(pos_in_list)
+
+        self.groups = {}
+        for key, members in groups.items():
+            num = np.array([int(trains[m]["train_id"][1:]) for m in members])
+            rows = np.array([row_of[n] for n in num])
+            starts = t_min[rows]
+            order = np.lexsort((num, starts))
+            self.groups[key] = {
+                "start": starts[order],
+                "end": t_max[rows][order],
+                "num": num[order],
+                "st_lo": st_min[rows][order],
+                "st_hi": st_max[rows][order],
+                "pos": np.array(members)[order],
+            }
+
+    def query(self, t_start=None, t_end=None, direction=None, train_type=None,
+              station_lo=None, station_hi=None, cursor=None, limit=100):
+        """
+        Trains overlapping [t_start, t_end] (hours), optionally restricted by
+        direction, train type and a station index range.
+
+        cursor: "<start>:<train number>" of the last item of the previous page.
+        Returns (trains, next_cursor, total_matches).
+        """
+        c_start, c_num = decode_cursor(cursor)
+
+        parts_start, parts_num, parts_pos = [], [], []
+        total = 0
+        for (g_dir, g_type), g in self.groups.items():
+            if direction and g_dir != direction.upper():
+                continue
+            if train_type and g_type.lower() != train_type.lower():
+                continue
+
+            # starts are sorted: everything after t_end cannot overlap
+            hi = len(g["start"]) if t_end is None else \
+                int(np.searchsorted(g["start"], t_end, side="right"))
+            mask = np.ones(hi, dtype=bool)
+            if t_start is not None:
+                mask &= g["end"][:hi] >= t_start
+            if station_lo is not None:
+                mask &= g["st_hi"][:hi] >= station_lo
+            if station_hi is not None:
+                mask &= g["st_lo"][:hi] <= station_hi
+            total += int(mask.sum())
+
+            if c_start is not None:
+                lo = int(np.searchsorted(g["start"][:hi], c_start, side="left"))
+                mask[:lo] = False
+                tie = (g["start"][:hi] == c_start) & (g["num"][:hi] <= c_num)
+                mask &= ~tie
+
+            sel = np.flatnonzero(mask)
+            parts_start.append(g["start"][sel])
+            parts_num.append(g["num"][sel])
+            parts_pos.append(g["pos"][sel])
+
+        if not parts_start:
+            return [], None, 0
+
+        starts = np.concatenate(parts_start)
+        nums = np.concatenate(parts_num)
+        poss = np.concatenate(parts_pos)
+        page = np.lexsort((nums, starts))[:limit]
+
+        items = [self.trains[int(p)] for p in poss[page]]
+        next_cursor = None
+        if len(page) == limit and len(starts) > limit:
+            last = page[-1]
+            next_cursor = f"{float(starts[last])!r}:{int(nums[last])}"
+        return items, next_cursor, total
+
+
+def decode_cursor(cursor):
+    if not cursor:
+        return None, None
+    try:
+        start, num = cursor.rsplit(":", 1)
+        return float(start), int(num)
+    except ValueError:
+        raise ValueError(f"invalid cursor {cursor!r}")
+
+
+def parse_station(value):
+    """Station code (e.g. "VZM") or index -> index, None if empty."""
+    if value is None or value == "":
+        return None
+    if value.strip().isdigit():
+        return int(value)
+    code = value.strip().upper()
+    if code not in STATION_CODES:
+        raise ValueError(f"unknown station {value!r}")
+    return STATION_CODES.index(code)
+
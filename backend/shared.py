@@ -0,0 +1,251 @@
+"""
+Shared-memory inputs and outputs for process-pool simulation workers.
+
+A compiled timetable is published once into a shared-memory block; every
+worker attaches to it in its pool initializer and wraps the same memory as
+NumPy views, so tasks only carry a small scenario dict. Trajectories, when
+wanted, are written by the workers into preallocated shared buffers (one
+slot per scenario) and read by the parent in place. Nothing large crosses
+a pipe in either direction.
+
+    with SharedRunner(workers=4, timetable=tt, trajectories=True) as runner:
+        kpis = runner.map(scenarios)
+        train, time, dist = runner.columns(0)
+
+Workers are spawned, not forked: the pool is created from request
+handlers of a threaded server, where forking can copy a lock held by
+another thread. Corridor topology is module-level in sim.py; the block
+lengths may have been replaced in the parent (set_block_lengths), so they
+travel with the pool initializer along with the timetable handle.
+"""
+import contextlib
+import io
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from sim import NUM_BLOCKS, UP_TRAINS, DOWN_TRAINS, FREIGHT_REQUESTED, CORRIDOR_BLOCK_LENGTHS
+
+_ALIGN = 64
+# a train logs its origin, then leave + arrive for every block at most
+ROWS_PER_TRAIN = 2 * NUM_BLOCKS + 2
+TIMETABLE_FIELDS = ("ttype", "dep", "start_st", "end_st", "stop_mask", "priority", "speed")
+
+
+# ===================== SHARED ARRAYS =====================
+
+class SharedArrays:
+    """
+    Named NumPy arrays packed into one shared-memory block.
+
+    `handle` is a small picklable (block name, layout) tuple; attach(handle)
+    in another process returns views on the same memory, no copy.
+    """
+
+    def __init__(self, shm, layout, owner):
+        self._shm = shm
+        self.layout = layout
+        self.owner = owner
+        self.arrays = {
+            name: np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf, offset=offset)
+            for name, dtype, shape, offset in layout
+        }
+
+    @classmethod
+    def create(cls, specs):
+        """specs: {name: ndarray to copy in | (shape, dtype) to allocate zeroed}."""
+        layout = []
+        size = 0
+        for name, spec in specs.items():
+            if isinstance(spec, np.ndarray):
+                shape, dtype = spec.shape, spec.dtype
+            else:
+                shape, dtype = spec
+                dtype = np.dtype(dtype)
+            size = -(-size // _ALIGN) * _ALIGN
+            layout.append((name, dtype.str, tuple(shape), size))
+            size += int(np.prod(shape, dtype=np.int64)) * dtype.itemsize
+
+        shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        out = cls(shm, tuple(layout), owner=True)
+        for name, spec in specs.items():
+            if isinstance(spec, np.ndarray):
+                out.arrays[name][...] = spec
+            else:
+                out.arrays[name].fill(0)
+        return out
+
+    @classmethod
+    def attach(cls, handle):
+        name, layout = handle
+        kwargs = {"track": False} if sys.version_info >= (3, 13) else {}
+        return cls(shared_memory.SharedMemory(name=name, **kwargs), layout, owner=False)
+
+    @property
+    def handle(self):
+        return self._shm.name, self.layout
+
+    @property
+    def nbytes(self):
+        return self._shm.size
+
+    def __getitem__(self, name):
+        return self.arrays[name]
+
+    def close(self):
+        # views must go before the mapping can be released
+        self.arrays = {}
+        self._shm.close()
+        if self.owner:
+            self._shm.unlink()
+
+
+# ===================== TIMETABLES =====================
+
+def publish_timetable(tt):
+    """Copy a compiled Timetable into shared memory (names included)."""
+    specs = {f: getattr(tt, f) for f in TIMETABLE_FIELDS}
+    specs["names"] = np.array(tt.names, dtype=str)
+    return SharedArrays.create(specs)
+
+
+def attach_timetable(shared):
+    """Timetable whose column arrays are views on a published block."""
+    from timetable import Timetable
+
+    return Timetable(names=shared["names"], **{f: shared[f] for f in TIMETABLE_FIELDS})
+
+
+# ===================== RESULT BUFFERS =====================
+
+def trajectory_buffers(slots, rows):
+    """One (train, time, dist) slot of `rows` rows per scenario, plus row counts."""
+    return SharedArrays.create({
+        "train": ((slots, rows), np.int32),
+        "time": ((slots, rows), np.float64),
+        "dist": ((slots, rows), np.float64),
+        "rows": ((slots,), np.int64),
+    })
+
+
+def write_trajectory(buffers, slot, df):
+    n = len(df)
+    if n > buffers["train"].shape[1]:
+        raise ValueError(f"trajectory of {n} rows does not fit a {buffers['train'].shape[1]}-row slot")
+    buffers["train"][slot, :n] = df.train.to_numpy()
+    buffers["time"][slot, :n] = df.time.to_numpy()
+    buffers["dist"][slot, :n] = df.dist.to_numpy()
+    buffers["rows"][slot] = n
+
+
+# ===================== WORKER SIDE =====================
+
+_worker_timetable = None
+_worker_blocks = []   # keeps attached blocks (and so their views) alive
+_worker_buffers = {}  # block name -> SharedArrays, attached once per worker
+
+
+def _init_worker(timetable_handle, block_lengths):
+    global _worker_timetable
+    from sim import set_block_lengths
+
+    set_block_lengths(block_lengths)
+    if timetable_handle is not None:
+        block = SharedArrays.attach(timetable_handle)
+        _worker_blocks.append(block)
+        _worker_timetable = attach_timetable(block)
+
+
+def _run_task(task):
+    from sim import run_sim
+    from sweep import scenario_kwargs, kpi_summary
+
+    slot, scenario, buffers_handle = task
+    kwargs = scenario_kwargs(scenario)
+    kwargs["timetable"] = _worker_timetable
+    kwargs["kpi_only"] = buffers_handle is None
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = run_sim(scenario["id"], **kwargs)
+
+    if buffers_handle is not None:
+        name = buffers_handle[0]
+        if name not in _worker_buffers:
+            # the parent reallocated: drop the mapping of the old block
+            for old in _worker_buffers.values():
+                old.close()
+            _worker_buffers.clear()
+            _worker_buffers[name] = SharedArrays.attach(buffers_handle)
+        write_trajectory(_worker_buffers[name], slot, result[0])
+    return kpi_summary(result)
+
+
+# ===================== PARENT SIDE =====================
+
+class SharedRunner:
+    """
+    Process pool whose workers read the timetable from shared memory and,
+    with trajectories=True, write each scenario's df_export rows into a
+    shared result slot instead of sending them back.
+    """
+
+    def __init__(self, workers=None, timetable=None, trajectories=False):
+        self.workers = workers or os.cpu_count() or 1
+        self.trajectories = trajectories
+        self.timetable = publish_timetable(timetable) if timetable is not None else None
+        trains = len(timetable) if timetable is not None else UP_TRAINS + DOWN_TRAINS + FREIGHT_REQUESTED
+        self.rows_per_slot = trains * ROWS_PER_TRAIN
+        self.buffers = None
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self.timetable.handle if self.timetable is not None else None,
+                      list(CORRIDOR_BLOCK_LENGTHS)),
+        )
+
+    def map(self, scenarios):
+        """
+        KPI dicts of the scenarios, in order. Slot i of the trajectory buffers
+        holds scenario i until the next map() call.
+        """
+        handle = None
+        if self.trajectories:
+            if self.buffers is None or self.buffers["rows"].shape[0] < len(scenarios):
+                if self.buffers is not None:
+                    self.buffers.close()
+                self.buffers = trajectory_buffers(len(scenarios), self.rows_per_slot)
+            self.buffers["rows"][:] = 0
+            handle = self.buffers.handle
+        tasks = [(i, s, handle) for i, s in enumerate(scenarios)]
+        return list(self._pool.map(_run_task, tasks))
+
+    def columns(self, slot):
+        """(train, time, dist) views of one scenario's rows, valid until the next map() / close()."""
+        n = int(self.buffers["rows"][slot])
+        return (self.buffers["train"][slot, :n], self.buffers["time"][slot, :n],
+                self.buffers["dist"][slot, :n])
+
+    def frame(self, slot):
+        """The slot as a DataFrame (copied out, safe to keep after close())."""
+        import pandas as pd
+
+        train, time, dist = self.columns(slot)
+        return pd.DataFrame({"train": train.copy(), "time": time.copy(), "dist": dist.copy()})
+
+    def close(self):
+        self._pool.shutdown()
+        for block in (self.timetable, self.buffers):
+            if block is not None:
+                block.close()
+        self.timetable = self.buffers = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
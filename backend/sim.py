@@ -1,11 +1,11 @@
 import simpy
-import pandas as pd
-import matplotlib.pyplot as plt
 from math import ceil, floor  # for directional track split
 from datetime import timedelta
 import random  # for local train start/end selection
+from array import array  # signal-section free-times
 
 train_stop_map = {}
+train_trips = {}  # tid -> TrainState, in departure order
 
 # ===================== GLOBAL CONFIG =====================
 
@@ -15,6 +15,7 @@ NUM_BLOCKS = NUM_STATIONS - 1
 UP_TRAINS = 50          # passenger only (UP)
 DOWN_TRAINS = 31        # passenger only (DOWN)
 DEPARTURE_GAP = 0.10    # hours
+FREIGHT_REQUESTED = 50  # freights per day, split evenly by direction
 
 MIN_HEADWAY_KM = 3.6  # for automatic block capacity
 
@@ -49,6 +50,8 @@ SPEED_FRT_LOADED = 60
 SPEED_FRT_EMPTY = 75
 
 DWELL_TIME = 0.05  # hours
+FREIGHT_LOOP_DECEL = 5 / 60.0  # hours, freight slowing into a loop station
+FREIGHT_LOOP_ACCEL = 7 / 60.0  # hours, freight back to line speed after it
 
 MAJOR_STATIONS = {0, 4, 18}
 
@@ -56,6 +59,27 @@ station_pos = [0]
 for l in CORRIDOR_BLOCK_LENGTHS:
     station_pos.append(station_pos[-1] + l)
 
+
+def set_block_lengths(lengths):
+    """
+    Replace the corridor block lengths (km, block order), e.g. with the
+    cached /infra block snapshot. Lists are updated in place, so modules
+    that imported station_pos see the new corridor.
+    Returns True if anything changed.
+    """
+    lengths = [float(l) for l in lengths]
+    if len(lengths) != NUM_BLOCKS:
+        raise ValueError(f"expected {NUM_BLOCKS} block lengths, got {len(lengths)}")
+    if lengths == CORRIDOR_BLOCK_LENGTHS:
+        return False
+
+    pos = [0]
+    for l in lengths:
+        pos.append(pos[-1] + l)
+    CORRIDOR_BLOCK_LENGTHS[:] = lengths
+    station_pos[:] = pos
+    return True
+
 # >>> Station codes, index 0..21
 STATION_CODES = [
     "KTV", "KPL", "ALM", "KUK", "VZM", "NML", "GVI", "CPP",
@@ -72,6 +96,7 @@ current_speed_multiplier = [1.0] * NUM_BLOCKS
 add_new_track_direction = None
 
 DAY_HOURS = 24.0  # horizon used for scheduling + freight throughput stats
+CANCEL_CHECK_EVENTS = 2000  # events processed between cancellation checks (~ms)
 
 # ===================== BEHAVIOUR TOGGLES =====================
 
@@ -116,16 +141,27 @@ def log_position(records, train, t, st, direction):
 # ===================== RAILWAY CLASS =====================
 
 class Railway:
-    def __init__(self, env, auto_blocks=None, block_caps=None):
+    def __init__(self, env, auto_blocks=None, block_caps=None, signal_spacing_km=None):
         """
         auto_blocks: list of block indices where automatic block signalling is enabled
         block_caps: dict {block_index: capacity}, full capacity map
                     (baseline + any manual overrides already merged before passing)
+        signal_spacing_km: opt-in signal-section mode (see below), None = off
 
         Interpretation:
         - capacity N = N physical tracks in that block
         - Split per direction: UP = ceil(N/2), DOWN = floor(N/2)
         - If N == 1 -> single bi-directional track (shared, with lock)
+
+        Signal-section mode:
+        - every direction-track of a multi-track block is a chain of signal
+          sections: int(length / signal_spacing_km) on auto-signalled blocks,
+          1 (absolute block) elsewhere
+        - a train may enter a section only once the train ahead has left it,
+          so following trains keep order and headway inside the block
+        - each track is just an array of section free-times (see
+          occupy_sections), not a SimPy resource per signal
+        - single-line blocks keep the shared lock + resource model
         """
         self.env = env
 
@@ -159,12 +195,37 @@ class Railway:
             self.down_blocks.append(simpy.PriorityResource(env, cap_dn))
             self.single_track_locks.append(lock)
 
+        # Signal sections: per block, per direction, one free-time array per track
+        self.up_sections = None
+        self.down_sections = None
+        if signal_spacing_km:
+            self.up_sections = []
+            self.down_sections = []
+            for i in range(NUM_BLOCKS):
+                n = 1
+                if auto_blocks and i in auto_blocks:
+                    n = max(1, int(CORRIDOR_BLOCK_LENGTHS[i] / signal_spacing_km))
+                self.up_sections.append(
+                    [array("d", bytes(8 * n)) for _ in range(self.up_blocks[i].capacity)])
+                self.down_sections.append(
+                    [array("d", bytes(8 * n)) for _ in range(self.down_blocks[i].capacity)])
+
         # Major stations = 3 tracks, others = 2 tracks
         self.stations = [
             simpy.PriorityResource(env, 3 if s in MAJOR_STATIONS else 2)
             for s in range(NUM_STATIONS)
         ]
 
+        # built on first use, i.e. once loops / new line are in place
+        self._kinematics = None
+
+    @property
+    def kinematics(self):
+        """Kinematics table of the current layout (reset by add_loop / enable_new_line)."""
+        if self._kinematics is None:
+            self._kinematics = Kinematics(self)
+        return self._kinematics
+
     def add_loop(self, st):
         if not (0 <= st < NUM_STATIONS):
             print(f"⚠ Warning: Station index {st} out of range, skipping loop")
@@ -173,10 +234,12 @@ class Railway:
             self.env,
             self.stations[st].capacity + 1
         )
+        self._kinematics = None
 
     def enable_new_line(self, direction):
         global add_new_track_direction
         add_new_track_direction = direction
+        self._kinematics = None
 
         # New track INCREASES usable capacity direction-wise
         for i in range(NUM_BLOCKS):
@@ -191,6 +254,37 @@ class Railway:
             self.single_track_locks[i] = None
 
 
+def occupy_sections(tracks, now, travel):
+    """
+    Book a run through a signalled block and return its exit time.
+
+    tracks: free-time arrays of the direction's parallel tracks; free[k] is
+    when the last train booked on that track leaves section k. The train
+    takes the track whose first section frees earliest, runs each section in
+    travel / n, and is held at the signal before section k + 1 until the
+    train ahead has left it. Booking rewrites free[] with this train's own
+    exit times, so the cost is O(sections) per block and no SimPy resources
+    are involved (trains ahead are already booked, so their times are final).
+    """
+    free = tracks[0]
+    for cand in tracks[1:]:
+        if cand[0] < free[0]:
+            free = cand
+
+    n = len(free)
+    tau = travel / n
+    t = free[0] if free[0] > now else now
+    for k in range(n - 1):
+        t += tau
+        nxt = free[k + 1]
+        if nxt > t:
+            t = nxt
+        free[k] = t
+    t += tau
+    free[n - 1] = t
+    return t
+
+
 def generate_stopping_pattern(train_id, is_local, start_st, end_st):
     """
     Returns a boolean list of length NUM_STATIONS.
@@ -229,15 +323,112 @@ def generate_stopping_pattern(train_id, is_local, start_st, end_st):
     return stops
 
 
+# ===================== KINEMATICS TABLES =====================
+
+# how a class of trains crosses a block (see Kinematics)
+BLOCK_NO_WAIT = 0      # new line in this direction: no block resource
+BLOCK_SECTIONS = 1     # signal sections (occupy_sections)
+BLOCK_SINGLE_LINE = 2  # single-line lock + direction resource
+BLOCK_MULTI_TRACK = 3  # direction resource only
+
+
+class KinematicsRow:
+    """
+    Everything one train class needs per block / station, precomputed:
+    travel[blk] (h), mode[blk] (BLOCK_*), dwell (h, passengers at stops),
+    decel[st] / accel[st] (h, freight loop penalties, 0.0 elsewhere),
+    plus the direction's block resources and section tracks.
+    """
+    __slots__ = ("travel", "mode", "dwell", "decel", "accel", "blocks", "sections")
+
+    def __init__(self, travel, mode, dwell, decel, accel, blocks, sections):
+        self.travel = travel
+        self.mode = mode
+        self.dwell = dwell
+        self.decel = decel
+        self.accel = accel
+        self.blocks = blocks
+        self.sections = sections
+
+
+class Kinematics:
+    """
+    Per-scenario kinematics table of a final Railway layout (loops,
+    speed-ups, new line), owned by Railway.kinematics. One row per
+    (speed, direction, freight) class, built on first use and shared by all
+    trains of that class, so a new speed class (e.g. SPEED_FRT_EMPTY) costs
+    one row, not per-step work.
+    """
+
+    def __init__(self, rail):
+        self.rail = rail
+        self.loop = [st.capacity > 2 for st in rail.stations]
+        self._rows = {}
+
+    def row(self, speed, is_up, is_freight):
+        key = (speed, is_up, is_freight)
+        r = self._rows.get(key)
+        if r is None:
+            r = self._rows[key] = self._build(speed, is_up, is_freight)
+        return r
+
+    def _build(self, speed, is_up, is_freight):
+        rail = self.rail
+        no_wait = add_new_track_direction and \
+            ((add_new_track_direction == "UP" and is_up) or
+             (add_new_track_direction == "DOWN" and not is_up))
+        sections = rail.up_sections if is_up else rail.down_sections
+
+        mode = []
+        for blk in range(NUM_BLOCKS):
+            if no_wait:
+                mode.append(BLOCK_NO_WAIT)
+            elif rail.single_track_locks[blk] is not None:
+                mode.append(BLOCK_SINGLE_LINE)
+            elif sections is not None:
+                mode.append(BLOCK_SECTIONS)
+            else:
+                mode.append(BLOCK_MULTI_TRACK)
+
+        return KinematicsRow(
+            travel=[CORRIDOR_BLOCK_LENGTHS[blk] / (speed * current_speed_multiplier[blk])
+                    for blk in range(NUM_BLOCKS)],
+            mode=mode,
+            dwell=DWELL_TIME,
+            decel=[FREIGHT_LOOP_DECEL if is_freight and lp else 0.0 for lp in self.loop],
+            accel=[FREIGHT_LOOP_ACCEL if is_freight and lp else 0.0 for lp in self.loop],
+            blocks=rail.up_blocks if is_up else rail.down_blocks,
+            sections=sections,
+        )
+
+
+class TrainState:
+    """
+    One departed train: its class row, stop pattern and trip record
+    (departure / arrival hours, start / end station), kept in train_trips.
+    """
+    __slots__ = ("kin", "stops", "start_st", "end_st", "dep", "arr")
+
+    def __init__(self, kin, stops, start_st, end_st, dep):
+        self.kin = kin
+        self.stops = stops
+        self.start_st = start_st
+        self.end_st = end_st
+        self.dep = dep
+        self.arr = None
+
+
 # ===================== TRAIN PROCESS =====================
 
 def train_process(env, tid, dir, rail, speed, ttype, dep, rec,
-                  start_st=None, end_st=None, is_freight=False):
+                  start_st=None, end_st=None, is_freight=False, priority=None):
     global block_wait_time, block_usage, station_wait_time, station_usage
-    global add_new_track_direction
 
     # Priority: passenger = 0, freight = 2 (higher number = lower priority)
-    pr = 0 if not is_freight else 2
+    if priority is None:
+        pr = 0 if not is_freight else 2
+    else:
+        pr = priority
     is_up = (dir == "UP")
 
     # Default behaviour (full section) if not overridden
@@ -251,69 +442,80 @@ def train_process(env, tid, dir, rail, speed, ttype, dep, rec,
     step = 1 if is_up else -1
 
     yield env.timeout(dep)
-    log_position(rec, tid, env.now, st, dir)
+    state = train_trips[tid] = TrainState(rail.kinematics.row(speed, is_up, is_freight),
+                                          train_stop_map[tid], start_st, last, env.now)
+    if rec is not None:
+        log_position(rec, tid, env.now, st, dir)
+
+    # class row unpacked once: the loop below does no arithmetic on speeds
+    kin = state.kin
+    travel, mode, decel, accel = kin.travel, kin.mode, kin.decel, kin.accel
+    dir_blocks, sections, locks = kin.blocks, kin.sections, rail.single_track_locks
+    stops = state.stops
+    stations = rail.stations
+    timeout = env.timeout
 
     while st != last:
         blk = st if is_up else st - 1
 
-        with rail.stations[st].request(priority=pr) as req:
+        with stations[st].request(priority=pr) as req:
             yield req
-            station_wait_time[st] += 0
             station_usage[st] += 1
 
             # ---------- STATION BEHAVIOUR ----------
             if not is_freight:
                 # Passenger: dwell only where scheduled to stop
-                if train_stop_map[tid][st]:
-                    yield env.timeout(DWELL_TIME)
-            else:
-                # Freight: ONLY slow if there is a loop here (capacity > 2)
-                if rail.stations[st].capacity > 2:
-                    yield env.timeout(5 / 60.0)  # 5 minutes decel into loop
+                if stops[st]:
+                    yield timeout(kin.dwell)
+            elif decel[st]:
+                # Freight: ONLY slow if there is a loop here
+                yield timeout(decel[st])
 
-            log_position(rec, tid, env.now, st, dir)
+            if rec is not None:
+                log_position(rec, tid, env.now, st, dir)
 
             # ---------- BLOCK TRAVEL ----------
-            no_wait = add_new_track_direction and \
-                ((add_new_track_direction == "UP" and is_up) or
-                 (add_new_track_direction == "DOWN" and not is_up))
-
-            travel = CORRIDOR_BLOCK_LENGTHS[blk] / (speed * current_speed_multiplier[blk])
+            t_run = travel[blk]
+            m = mode[blk]
 
-            if no_wait:
+            if m == BLOCK_NO_WAIT:
                 # New line in this direction: ignore block resource (effectively infinite tracks)
-                yield env.timeout(travel)
-            else:
-                # Direction-wise resources + optional single-track lock
-                dir_blocks = rail.up_blocks if is_up else rail.down_blocks
-                lock = rail.single_track_locks[blk]
-
-                if lock is not None:
-                    # True single-line section: UP and DOWN mutually exclusive
-                    with lock.request(priority=pr) as lreq:
-                        yield lreq
-                        t_before = env.now
-                        with dir_blocks[blk].request(priority=pr) as b:
-                            yield b
-                            block_wait_time[blk] += env.now - t_before
-                            block_usage[blk] += 1
-                            yield env.timeout(travel)
-                else:
-                    # Multi-track: tracks split by direction (no cross-direction conflict)
+                yield timeout(t_run)
+            elif m == BLOCK_SECTIONS:
+                # Signal sections: book the run, wait + travel in one timeout
+                t_exit = occupy_sections(sections[blk], env.now, t_run)
+                block_wait_time[blk] += t_exit - env.now - t_run
+                block_usage[blk] += 1
+                yield timeout(t_exit - env.now)
+            elif m == BLOCK_SINGLE_LINE:
+                # True single-line section: UP and DOWN mutually exclusive
+                with locks[blk].request(priority=pr) as lreq:
+                    yield lreq
                     t_before = env.now
                     with dir_blocks[blk].request(priority=pr) as b:
                         yield b
                         block_wait_time[blk] += env.now - t_before
                         block_usage[blk] += 1
-                        yield env.timeout(travel)
+                        yield timeout(t_run)
+            else:
+                # Multi-track: tracks split by direction (no cross-direction conflict)
+                t_before = env.now
+                with dir_blocks[blk].request(priority=pr) as b:
+                    yield b
+                    block_wait_time[blk] += env.now - t_before
+                    block_usage[blk] += 1
+                    yield timeout(t_run)
 
             # ---------- POST-BLOCK ACCEL FOR FREIGHT ----------
-            if is_freight and rail.stations[st].capacity > 2:
+            if accel[st]:
                 # Accelerate back to line speed after leaving loop
-                yield env.timeout(7 / 60.0)  # 7 minutes accel
+                yield timeout(accel[st])
 
         st += step
-        log_position(rec, tid, env.now, st, dir)
+        if rec is not None:
+            log_position(rec, tid, env.now, st, dir)
+
+    state.arr = env.now
 
 
 def build_departure_times(num_trains, start=0.0, end=DAY_HOURS):
@@ -330,30 +532,17 @@ def build_departure_times(num_trains, start=0.0, end=DAY_HOURS):
     return [start + i * headway for i in range(num_trains)]
 
 
-# ===================== SIM RUNNER =====================
+# ===================== SCENARIO SETUP =====================
 
-def run_sim(label, loop_stations=None, auto_blocks=None, speed_up_blocks=None,
-            block_capacities=None, new_track_direction=None):
+def build_scenario(env, loop_stations=None, auto_blocks=None, speed_up_blocks=None,
+                   block_capacities=None, new_track_direction=None, signal_spacing_km=None):
     """
-    block_capacities: dict {block_index: capacity}
-        - EXTRA per-block capacity (on top of BASELINE_BLOCK_CAPS)
-        - Manual per-block capacity (highest priority over auto_blocks)
-
-    Returns:
-        df_export,
-        simulation_time,
-        block_wait_time,
-        block_usage,
-        station_wait_time,
-        station_usage,
-        freight_finished (throughput),
-        avg_freight_travel_time,
-        avg_freight_speed
+    Reset the global KPI accumulators and build the Railway for one scenario.
+    Shared by run_sim and run_sim_multiday.
     """
-
     global block_wait_time, block_usage, station_wait_time, station_usage
     global current_speed_multiplier, add_new_track_direction
-    global train_stop_map
+    global train_stop_map, train_trips
 
     block_wait_time = [0.0] * NUM_BLOCKS
     block_usage = [0] * NUM_BLOCKS
@@ -362,6 +551,7 @@ def run_sim(label, loop_stations=None, auto_blocks=None, speed_up_blocks=None,
     current_speed_multiplier = [1.0] * NUM_BLOCKS
     add_new_track_direction = None
     train_stop_map = {}
+    train_trips = {}
 
     # Start with baseline infra capacities
     merged_caps = dict(BASELINE_BLOCK_CAPS)
@@ -381,9 +571,7 @@ def run_sim(label, loop_stations=None, auto_blocks=None, speed_up_blocks=None,
             else:
                 print(f"⚠ Warning: Ignoring invalid speed-up block index {b}")
 
-    rec = []
-    env = simpy.Environment()
-    rail = Railway(env, auto_blocks, merged_caps)
+    rail = Railway(env, auto_blocks, merged_caps, signal_spacing_km)
 
     # Global loops (optional)
     if USE_GLOBAL_LOOPS:
@@ -398,16 +586,25 @@ def run_sim(label, loop_stations=None, auto_blocks=None, speed_up_blocks=None,
     if new_track_direction:
         rail.enable_new_line(new_track_direction)
 
-    # ========== TRAIN GENERATION (24-hour horizon) ==========
+    return rail
+
 
-    random.seed(42)
+# ===================== DAILY TIMETABLE =====================
+
+def schedule_day(env, rail, rec, tid=0):
+    """
+    Start the processes for one 24-hour timetable, with departures counted
+    from env.now. Train ids are allocated from `tid` upwards.
+
+    Returns (processes, freight_ids, next_tid).
+    """
+    procs = []
+    freight_ids = []
 
     # Precompute departure times over 24 hours, separately for each direction
     up_departures = build_departure_times(UP_TRAINS, start=0.0, end=DAY_HOURS)
     down_departures = build_departure_times(DOWN_TRAINS, start=0.0, end=DAY_HOURS)
 
-    tid = 0
-
     # ---------- UP TRAINS: half long, half short ----------
     up_long = UP_TRAINS // 2
     up_short = UP_TRAINS - up_long
@@ -421,8 +618,8 @@ def run_sim(label, loop_stations=None, auto_blocks=None, speed_up_blocks=None,
         train_stop_map[tid] = generate_stopping_pattern(tid, (tt == "LOC"), start_st, end_st)
 
         dep_time = up_departures[i]
-        env.process(train_process(env, tid, "UP", rail, sp, tt, dep_time, rec,
-                                  start_st=start_st, end_st=end_st))
+        procs.append(env.process(train_process(env, tid, "UP", rail, sp, tt, dep_time, rec,
+                                               start_st=start_st, end_st=end_st)))
         tid += 1
 
     # Short-distance UP (start & end inside section)
@@ -435,8 +632,8 @@ def run_sim(label, loop_stations=None, auto_blocks=None, speed_up_blocks=None,
         train_stop_map[tid] = generate_stopping_pattern(tid, (tt == "LOC"), start_st, end_st)
 
         dep_time = up_departures[i + up_long]
-        env.process(train_process(env, tid, "UP", rail, sp, tt, dep_time, rec,
-                                  start_st=start_st, end_st=end_st))
+        procs.append(env.process(train_process(env, tid, "UP", rail, sp, tt, dep_time, rec,
+                                               start_st=start_st, end_st=end_st)))
         tid += 1
 
     # ---------- DOWN TRAINS: half long, half short ----------
@@ -452,8 +649,8 @@ def run_sim(label, loop_stations=None, auto_blocks=None, speed_up_blocks=None,
         train_stop_map[tid] = generate_stopping_pattern(tid, (tt == "LOC"), start_st, end_st)
 
         dep_time = down_departures[i]
-        env.process(train_process(env, tid, "DOWN", rail, sp, tt, dep_time, rec,
-                                  start_st=start_st, end_st=end_st))
+        procs.append(env.process(train_process(env, tid, "DOWN", rail, sp, tt, dep_time, rec,
+                                               start_st=start_st, end_st=end_st)))
         tid += 1
 
     # Short-distance DOWN (start & end inside section, reversed direction)
@@ -466,13 +663,12 @@ def run_sim(label, loop_stations=None, auto_blocks=None, speed_up_blocks=None,
         train_stop_map[tid] = generate_stopping_pattern(tid, (tt == "LOC"), start_st, end_st)
 
         dep_time = down_departures[i + down_long]
-        env.process(train_process(env, tid, "DOWN", rail, sp, tt, dep_time, rec,
-                                  start_st=start_st, end_st=end_st))
+        procs.append(env.process(train_process(env, tid, "DOWN", rail, sp, tt, dep_time, rec,
+                                               start_st=start_st, end_st=end_st)))
         tid += 1
 
     # ========== FREIGHT INSERTION (gap-based, horizon-limited) ==========
 
-    FREIGHT_REQUESTED = 50  # or whatever you like
     max_per_dir = FREIGHT_REQUESTED // 2
 
     freight_up_deps = []
@@ -504,14 +700,15 @@ def run_sim(label, loop_stations=None, auto_blocks=None, speed_up_blocks=None,
 
         train_stop_map[tid] = [False] * NUM_STATIONS
 
-        env.process(train_process(
+        procs.append(env.process(train_process(
             env, tid, "UP", rail, sp, tt,
             dep=dep,
             rec=rec,
             start_st=start_st,
             end_st=end_st,
             is_freight=True
-        ))
+        )))
+        freight_ids.append(tid)
         tid += 1
 
     # Create DOWN freights
@@ -525,27 +722,61 @@ def run_sim(label, loop_stations=None, auto_blocks=None, speed_up_blocks=None,
 
         train_stop_map[tid] = [False] * NUM_STATIONS
 
-        env.process(train_process(
+        procs.append(env.process(train_process(
             env, tid, "DOWN", rail, sp, tt,
             dep=dep,
             rec=rec,
             start_st=start_st,
             end_st=end_st,
             is_freight=True
-        ))
+        )))
+        freight_ids.append(tid)
         tid += 1
 
-    # ========== RUN ==========
-    env.run()
-    print(f"{label} finished in {env.now:.2f}h")
+    return procs, freight_ids, tid
 
-    # ========== POST-SIM FREIGHT THROUGHPUT & SPEED ==========
-    df = pd.DataFrame(rec, columns=["train", "time", "dist"])
 
-    passenger_cutoff = UP_TRAINS + DOWN_TRAINS
+def schedule_timetable(env, rail, rec, timetable, mean_delay=0.0, seed=42):
+    """
+    Start a loaded timetable (see timetable.py). A single feeder process
+    releases trains in departure order, so only trains that have departed
+    hold a process and a stop pattern.
+    Train ids are timetable row indexes (passengers first, then freights).
+
+    mean_delay > 0 adds a seeded exponential primary delay (hours, that
+    mean) to every departure, so replications of a timetable differ.
+    """
+    deps = timetable.dep.tolist()
+    if mean_delay > 0:
+        rng = random.Random(seed)
+        deps = [d + rng.expovariate(1.0 / mean_delay) for d in deps]
+    order = sorted(range(len(deps)), key=deps.__getitem__)
+
+    def feeder(env):
+        for tid in order:
+            dir, tt, sp, start_st, end_st, is_freight, pr, _ = timetable.train(tid)
+            dep = deps[tid]
+            if dep > env.now:
+                yield env.timeout(dep - env.now)
+
+            train_stop_map[tid] = timetable.stops(tid)
+            env.process(train_process(env, tid, dir, rail, sp, tt, 0.0, rec,
+                                      start_st=start_st, end_st=end_st,
+                                      is_freight=is_freight, priority=pr))
+
+    env.process(feeder(env))
+
+
+def freight_stats(freight_df, horizon_end):
+    """
+    Freight throughput over a trajectory frame holding only freight rows.
+    A freight counts as finished if it covered the full corridor and
+    arrived by `horizon_end`.
+
+    Returns (finished_ids, avg_travel_time, avg_speed).
+    """
     full_len = station_pos[-1]
 
-    freight_df = df[df.train >= passenger_cutoff]
     finished_ids = []
     total_time = 0.0
     total_speed = 0.0
@@ -555,13 +786,17 @@ def run_sim(label, loop_stations=None, auto_blocks=None, speed_up_blocks=None,
         dep = tdf.time.iloc[0]
         arr = tdf.time.iloc[-1]
 
-        # must arrive within 24h horizon
-        if arr > DAY_HOURS:
+        # must arrive within the horizon
+        if arr > horizon_end:
             continue
 
         # must reach near end-to-end
         if abs(abs(tdf.dist.iloc[-1]) - full_len) > 1e-3:
             continue
+        # ... having started from the other end (loaded timetables also carry
+        # part-corridor freights)
+        if abs(tdf.dist.iloc[0]) > 1e-3:
+            continue
 
         trav = arr - dep
         if trav <= 0:
@@ -571,9 +806,144 @@ def run_sim(label, loop_stations=None, auto_blocks=None, speed_up_blocks=None,
         total_time += trav
         total_speed += full_len / trav
 
+    n = len(finished_ids)
+    avg_frt_time = total_time / n if n > 0 else 0.0
+    avg_frt_speed = total_speed / n if n > 0 else 0.0
+    return finished_ids, avg_frt_time, avg_frt_speed
+
+
+def freight_stats_online(passenger_cutoff, horizon_end):
+    """
+    Same result as freight_stats, computed from train_trips instead of a
+    trajectory frame (KPI-only runs). train_trips is in departure order,
+    which is the order freight_stats meets trains in, so the float sums
+    come out bit-for-bit identical.
+    """
+    full_len = station_pos[-1]
+
+    finished_ids = []
+    total_time = 0.0
+    total_speed = 0.0
+
+    for tid_f, trip in train_trips.items():
+        if tid_f < passenger_cutoff or trip.arr is None:
+            continue
+
+        # same checks as freight_stats: on time, full corridor from the origin end
+        if trip.arr > horizon_end:
+            continue
+        if abs(station_pos[trip.end_st] - full_len) > 1e-3:
+            continue
+        if station_pos[trip.start_st] > 1e-3:
+            continue
+
+        trav = trip.arr - trip.dep
+        if trav <= 0:
+            continue
+
+        finished_ids.append(tid_f)
+        total_time += trav
+        total_speed += full_len / trav
+
+    n = len(finished_ids)
+    avg_frt_time = total_time / n if n > 0 else 0.0
+    avg_frt_speed = total_speed / n if n > 0 else 0.0
+    return finished_ids, avg_frt_time, avg_frt_speed
+
+
+# ===================== SIM RUNNER =====================
+
+class SimulationCancelled(Exception):
+    """Raised by run_sim when its cancel token is set mid-run."""
+
+
+def run_to_end(env, cancel=None):
+    """
+    env.run() in slices of CANCEL_CHECK_EVENTS events, checking `cancel`
+    (anything with is_set(), e.g. threading.Event) between slices.
+    env.now ends on the last event exactly as with env.run().
+    """
+    if cancel is None:
+        env.run()
+        return
+
+    step = env.step
+    batch = range(CANCEL_CHECK_EVENTS)
+    try:
+        while True:
+            if cancel.is_set():
+                raise SimulationCancelled()
+            for _ in batch:
+                step()
+    except simpy.core.EmptySchedule:
+        pass
+
+
+def run_sim(label, loop_stations=None, auto_blocks=None, speed_up_blocks=None,
+            block_capacities=None, new_track_direction=None, timetable=None,
+            signal_spacing_km=None, seed=42, kpi_only=False, cancel=None,
+            mean_departure_delay=0.0):
+    """
+    block_capacities: dict {block_index: capacity}
+        - EXTRA per-block capacity (on top of BASELINE_BLOCK_CAPS)
+        - Manual per-block capacity (highest priority over auto_blocks)
+    timetable: compiled timetable.Timetable to run instead of the
+        synthetic 24-hour train mix
+    signal_spacing_km: enable signal-section mode (e.g. MIN_HEADWAY_KM),
+        see Railway; None keeps the one-resource-per-block model
+    seed: seeds the random stopping patterns and short-train routes
+        (and the departure delays of a timetable run)
+    mean_departure_delay: hours; > 0 gives every timetable train a seeded
+        exponential primary delay (see schedule_timetable). A loaded
+        timetable is otherwise deterministic, whatever the seed.
+    kpi_only: skip trajectory logging and the DataFrame; df_export is None
+        and every KPI is computed from online accumulators (same values)
+    cancel: optional token (threading.Event); once set, the run stops at
+        the next time slice and raises SimulationCancelled
+
+    Returns:
+        df_export,
+        simulation_time,
+        block_wait_time,
+        block_usage,
+        station_wait_time,
+        station_usage,
+        freight_finished (throughput),
+        avg_freight_travel_time,
+        avg_freight_speed
+    """
+
+    rec = None if kpi_only else []
+    env = simpy.Environment()
+    rail = build_scenario(env, loop_stations, auto_blocks, speed_up_blocks,
+                          block_capacities, new_track_direction, signal_spacing_km)
+
+    # ========== TRAIN GENERATION (24-hour horizon) ==========
+
+    if timetable is not None:
+        schedule_timetable(env, rail, rec, timetable, mean_departure_delay, seed)
+        passenger_cutoff = timetable.num_passenger
+    else:
+        random.seed(seed)
+        schedule_day(env, rail, rec)
+        passenger_cutoff = UP_TRAINS + DOWN_TRAINS
+
+    # ========== RUN ==========
+    run_to_end(env, cancel)
+    print(f"{label} finished in {env.now:.2f}h")
+
+    # ========== POST-SIM FREIGHT THROUGHPUT & SPEED ==========
+    if kpi_only:
+        df = None
+        finished_ids, avg_frt_time, avg_frt_speed = freight_stats_online(passenger_cutoff, DAY_HOURS)
+    else:
+        import pandas as pd
+
+        df = pd.DataFrame(rec, columns=["train", "time", "dist"])
+
+        freight_df = df[df.train >= passenger_cutoff]
+        finished_ids, avg_frt_time, avg_frt_speed = freight_stats(freight_df, DAY_HOURS)
     freight_finished = len(finished_ids)
-    avg_frt_time = total_time / freight_finished if freight_finished > 0 else 0.0
-    avg_frt_speed = total_speed / freight_finished if freight_finished > 0 else 0.0
 
     print(f"📦 Freight Finished (within 24h): {freight_finished}")
     if freight_finished > 0:
@@ -581,7 +951,9 @@ def run_sim(label, loop_stations=None, auto_blocks=None, speed_up_blocks=None,
         print(f"⚡ Avg Freight Speed: {avg_frt_speed:.1f} km/h")
 
     # Expose only passenger + COMPLETED freights (Option A)
-    if freight_finished > 0:
+    if df is None:
+        df_export = None
+    elif freight_finished > 0:
         df_export = df[(df.train < passenger_cutoff) | (df.train.isin(finished_ids))]
     else:
         df_export = df[df.train < passenger_cutoff]
@@ -599,6 +971,219 @@ def run_sim(label, loop_stations=None, auto_blocks=None, speed_up_blocks=None,
     )
 
 
+# ===================== WARM-UP =====================
+
+def warm_up():
+    """
+    Run a tiny three-train scenario through the full run -> DataFrame ->
+    freight stats -> JSON formatting path, so imports and first-call costs
+    are paid before the first real request.
+    """
+    import pandas as pd
+
+    env = simpy.Environment()
+    rail = build_scenario(env)
+    rec = []
+
+    for tid, d, start_st, end_st, freight in ((0, "UP", 0, 3, False),
+                                              (1, "DOWN", 3, 0, False),
+                                              (2, "UP", 0, 3, True)):
+        train_stop_map[tid] = [True] * NUM_STATIONS
+        env.process(train_process(env, tid, d, rail, SPEED_EXPRESS, "EXP", 0.0, rec,
+                                  start_st=start_st, end_st=end_st, is_freight=freight))
+    env.run()
+
+    df = pd.DataFrame(rec, columns=["train", "time", "dist"])
+    freight_stats(df[df.train == 2], DAY_HOURS)
+    format_train_segments(df)
+    return env.now
+
+
+# ===================== MULTI-DAY RUNNER =====================
+
+class CsvChunkSink:
+    """
+    Appends trajectory chunks to a CSV file as days complete.
+    Any callable sink(day, df_chunk) can be used instead.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._header = True
+
+    def __call__(self, day, df_chunk):
+        df_chunk.assign(day=day).to_csv(
+            self.path, mode="w" if self._header else "a",
+            header=self._header, index=False
+        )
+        self._header = False
+
+
+def run_sim_multiday(label, days, sink=None, loop_stations=None, auto_blocks=None,
+                     speed_up_blocks=None, block_capacities=None, new_track_direction=None,
+                     signal_spacing_km=None, seed=42):
+    """
+    Run `days` consecutive copies of the daily timetable on one corridor, so
+    backlogs carry over from day to day.
+
+    Trajectories are buffered per timetable day only until every train of
+    that day has arrived, then handed to `sink(day, df_chunk)` (or dropped
+    if no sink is given). KPIs are kept as running per-day aggregates, so
+    memory stays flat as the horizon grows.
+
+    Returns a dict:
+        simulation_time, block_wait_time, block_usage, station_wait_time,
+        station_usage (whole horizon) and "per_day": [
+            {day, block_wait_time, block_usage, station_usage,
+             trains_departed, trains_arrived, freight_finished,
+             avg_freight_travel_time, avg_freight_speed}, ...]
+    """
+    if days < 1:
+        raise ValueError("days must be >= 1")
+
+    env = simpy.Environment()
+    rail = build_scenario(env, loop_stations, auto_blocks, speed_up_blocks,
+                          block_capacities, new_track_direction, signal_spacing_km)
+
+    random.seed(seed)
+
+    per_day = [{
+        "day": d,
+        "block_wait_time": [0.0] * NUM_BLOCKS,
+        "block_usage": [0] * NUM_BLOCKS,
+        "station_usage": [0] * NUM_STATIONS,
+        "trains_departed": 0,
+        "trains_arrived": 0,
+        "freight_finished": 0,
+        "avg_freight_travel_time": 0.0,
+        "avg_freight_speed": 0.0,
+    } for d in range(days)]
+
+    # block/station counters are cumulative -> diff them at each day boundary
+    marks = {
+        "wait": [0.0] * NUM_BLOCKS,
+        "use": [0] * NUM_BLOCKS,
+        "st": [0] * NUM_STATIONS,
+    }
+
+    def close_day(d):
+        row = per_day[d]
+        row["block_wait_time"] = [w - p for w, p in zip(block_wait_time, marks["wait"])]
+        row["block_usage"] = [u - p for u, p in zip(block_usage, marks["use"])]
+        row["station_usage"] = [u - p for u, p in zip(station_usage, marks["st"])]
+        marks["wait"] = block_wait_time.copy()
+        marks["use"] = block_usage.copy()
+        marks["st"] = station_usage.copy()
+
+    def day_kpis(env):
+        for d in range(days - 1):
+            yield env.timeout(DAY_HOURS)
+            close_day(d)
+
+    def flush_day(env, d, procs, day_ids, freight_ids, rec):
+        import pandas as pd
+
+        yield env.all_of(procs)
+
+        df = pd.DataFrame(rec, columns=["train", "time", "dist"])
+        rec.clear()
+        for t in day_ids:
+            train_stop_map.pop(t, None)
+            train_trips.pop(t, None)
+
+        t0 = d * DAY_HOURS
+        row = per_day[d]
+        row["trains_departed"] = len(procs)
+
+        finished, avg_t, avg_s = freight_stats(df[df.train.isin(freight_ids)], t0 + DAY_HOURS)
+        row["freight_finished"] = len(finished)
+        row["avg_freight_travel_time"] = avg_t
+        row["avg_freight_speed"] = avg_s
+
+        # arrivals are credited to the day the train actually arrived
+        for arr in df.groupby("train").time.max():
+            arr_day = int(arr // DAY_HOURS)
+            if arr_day < days:
+                per_day[arr_day]["trains_arrived"] += 1
+
+        if sink is not None:
+            sink(d, df)
+
+    def timetable(env):
+        tid = 0
+        for d in range(days):
+            rec = []
+            first = tid
+            procs, freight_ids, tid = schedule_day(env, rail, rec, tid)
+            env.process(flush_day(env, d, procs, range(first, tid), freight_ids, rec))
+            yield env.timeout(DAY_HOURS)
+
+    env.process(day_kpis(env))
+    env.process(timetable(env))
+    env.run()
+    # the last day also absorbs the run-out past the horizon
+    close_day(days - 1)
+    print(f"{label} ({days} days) finished in {env.now:.2f}h")
+
+    return {
+        "simulation_time": env.now,
+        "block_wait_time": block_wait_time.copy(),
+        "block_usage": block_usage.copy(),
+        "station_wait_time": station_wait_time.copy(),
+        "station_usage": station_usage.copy(),
+        "per_day": per_day,
+    }
+
+
+def main_multiday(argv=None):
+    """
+    CLI for run_sim_multiday:
+        python sim.py --days 7 --out traj.csv
+        python sim.py --days 30 --loops 10,13 --kpis week.json
+    """
+    import argparse
+    import json
+
+    ap = argparse.ArgumentParser(description="Multi-day run of the daily timetable")
+    ap.add_argument("--days", type=int, required=True)
+    ap.add_argument("--out", help="CSV file the trajectories are appended to, day by day")
+    ap.add_argument("--kpis", help="write the returned KPI dict (incl. per_day) as JSON")
+    ap.add_argument("--auto-blocks")
+    ap.add_argument("--loops")
+    ap.add_argument("--speed-up", help="block:multiplier,... e.g. 17:1.5,18:1.2")
+    ap.add_argument("--seed", type=int, default=42)
+    args = ap.parse_args(argv)
+
+    def int_list(text):
+        return [int(x) for x in text.split(",") if x.strip().isdigit()] if text else None
+
+    speed_up = None
+    if args.speed_up:
+        speed_up = {int(b): float(m) for b, m in
+                    (item.split(":") for item in args.speed_up.split(",") if ":" in item)}
+
+    out = run_sim_multiday(
+        "MultiDay", args.days,
+        sink=CsvChunkSink(args.out) if args.out else None,
+        auto_blocks=int_list(args.auto_blocks),
+        loop_stations=int_list(args.loops),
+        speed_up_blocks=speed_up,
+        seed=args.seed,
+    )
+
+    for row in out["per_day"]:
+        print(f"📅 Day {row['day']}: {row['trains_departed']} departed, "
+              f"{row['trains_arrived']} arrived, {row['freight_finished']} freight finished, "
+              f"avg freight speed {row['avg_freight_speed']:.1f} km/h")
+    if args.out:
+        print(f"💾 Trajectories written to {args.out}")
+    if args.kpis:
+        with open(args.kpis, "w") as f:
+            json.dump(out, f, default=float)
+        print(f"📦 KPIs written to {args.kpis}")
+
+
+
 # ===================== ANALYSIS =====================
 
 def top_k_blocks(n):
@@ -611,8 +1196,11 @@ def top_k_stations(n):
     return sorted(score, key=lambda x: (-x[1], -x[2]))[:n]
 
 
-def format_train_segments(df):
+def format_train_segments(df, passenger_cutoff=None, train_names=None):
     """
+    passenger_cutoff: first freight train id (default: synthetic timetable)
+    train_names: optional names indexed by train id (loaded timetables)
+
     Build JSON-friendly structure:
 
     {
@@ -631,7 +1219,8 @@ def format_train_segments(df):
     }
     """
     trains_data = []
-    passenger_cutoff = UP_TRAINS + DOWN_TRAINS
+    if passenger_cutoff is None:
+        passenger_cutoff = UP_TRAINS + DOWN_TRAINS
 
     for train_id in df.train.unique():
         tdf = df[df.train == train_id].sort_values("time")
@@ -676,7 +1265,7 @@ def format_train_segments(df):
 
         train_info = {
             "train_id": f"T{train_id}",
-            "train_name": f"Train-{train_id}",
+            "train_name": train_names[train_id] if train_names else f"Train-{train_id}",
             "direction": direction,
             "train_type": train_type,
             "color": color,
@@ -691,6 +1280,11 @@ def format_train_segments(df):
 # ===================== MAIN (kept mostly as-is for CLI use) =====================
 
 if __name__ == "__main__":
+    import sys
+
+    # `python sim.py --days N ...`: multi-day study; no arguments: the analysis below
+    if any(a.split("=")[0] == "--days" for a in sys.argv[1:]):
+        sys.exit(main_multiday(sys.argv[1:]))
 
     print("\n===== BASELINE RUN =====")
     df_base, T_base, *_ = run_sim("Baseline")
@@ -773,70 +1367,10 @@ if __name__ == "__main__":
     track_imp = T_base - T_track
     print(f"⭐ New track improvement: +{track_imp:.2f}h")
 
-    # Distance–time plot (uses raw station positions but we could change to STATION_CODES labels)
-    plt.figure(figsize=(14, 8))
+    from plots import plot_baseline_vs_scenario, plot_full_timetable
 
-    for t in df_base.train.unique():
-        seg = df_base[df_base.train == t]
-        y = seg.dist.abs()
-        plt.plot(seg.time, y, color="gray", alpha=0.30, linewidth=0.7)
-
-    for t in df_scen.train.unique():
-        seg = df_scen[df_scen.train == t]
-        y = seg.dist.abs()
-        color = "blue" if seg.dist.iloc[0] > 0 else "red"
-        plt.plot(seg.time, y, linewidth=1.8, color=color)
-
-    plt.grid(True)
-    plt.title(
-        f"Baseline vs {scenario_label} Scenario\n"
-        f"Impr: +{imp_manual:.2f}h"
-    )
-    plt.xlabel("Time (hours)")
-    plt.ylabel("Distance (km)")
-    plt.yticks(station_pos, STATION_CODES)
-    plt.ylim(0, max(station_pos) + 5)
-    plt.tight_layout()
-    plt.savefig("baseline_vs_scenario.png")
+    plot_baseline_vs_scenario(df_base, df_scen, scenario_label, imp_manual)
 
     # FULL DT GRAPH WITH 4 COLORS
     print("\n📊 Plotting Full Timetable Distance vs Time Graph...")
-
-    plt.figure(figsize=(15, 9))
-
-    passenger_cutoff = UP_TRAINS + DOWN_TRAINS
-
-    for tid in df_scen.train.unique():
-        seg = df_scen[df_scen.train == tid].sort_values("time")
-        y = seg.dist.abs()
-        is_up = seg.dist.iloc[0] >= 0
-
-        if tid < UP_TRAINS:
-            color = "blue"          # UP Passenger
-        elif tid < passenger_cutoff:
-            color = "red"           # DOWN Passenger
-        else:
-            color = "green" if is_up else "orange"  # Freights
-
-        plt.plot(seg.time, y, color=color, linewidth=1.1, alpha=0.9)
-
-    plt.yticks(station_pos, STATION_CODES, fontsize=8)
-    plt.grid(True, linestyle="--", alpha=0.3)
-    plt.xlabel("Time (hours)")
-    plt.ylabel("Distance (km)")
-    plt.title(
-        "Full Distance–Time Timetable Chart\n"
-        f"{scenario_label} Scenario Runtime: {T_scen:.2f}h"
-    )
-
-    from matplotlib.lines import Line2D
-    legend_elements = [
-        Line2D([0], [0], color="blue", lw=2, label="UP Passenger"),
-        Line2D([0], [0], color="red", lw=2, label="DOWN Passenger"),
-        Line2D([0], [0], color="green", lw=2, label="UP Freight"),
-        Line2D([0], [0], color="orange", lw=2, label="DOWN Freight"),
-    ]
-    plt.legend(handles=legend_elements, loc="upper right")
-
-    plt.tight_layout()
-    plt.savefig("full_timetable_classified_dt_chart.png")
\ No newline at end of file
+    plot_full_timetable(df_scen, scenario_label, T_scen)
@@ -0,0 +1,483 @@
+"""
+Distributed scenario sweeps: one coordinator, many workers.
+
+The coordinator owns a SweepQueue of scenario chunks. Workers pull a chunk,
+run each scenario through run_sim and send back KPI summaries. Workers talk
+to the coordinator over plain TCP (length-prefixed JSON frames) or, on one
+box, over multiprocessing pipes; the worker loop is the same for both.
+
+- a chunk handed to a worker is leased; if the worker disconnects or the
+  lease expires, the chunk goes back on the queue (up to MAX_ATTEMPTS)
+- results are keyed by scenario id, so a chunk finished twice (slow worker
+  + retry) is only counted once
+- progress() aggregates done / failed / in-flight counts and throughput
+
+Usage:
+    python sweep.py coordinator --port 5555 [--scenarios sweep.json]
+    python sweep.py worker --connect coordinator-host:5555
+    python sweep.py local --workers 4            # coordinator + 4 local worker processes
+"""
+import argparse
+import contextlib
+import io
+import json
+import socket
+import struct
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+
+CHUNK_SIZE = 4
+LEASE_TIMEOUT_SEC = 600.0
+MAX_ATTEMPTS = 3
+# local workers still busy once the sweep has settled (e.g. re-running a chunk
+# whose lease expired) get this long to finish before they are terminated
+WORKER_EXIT_TIMEOUT_SEC = 10.0
+
+_HEADER = struct.Struct("!I")
+
+
+# ===================== SCENARIOS & KPIs =====================
+
+def default_sweep():
+    """Single-change scenarios: a loop at every station, a 1.25x speed-up on every block."""
+    from sim import NUM_STATIONS, NUM_BLOCKS
+
+    scenarios = [{"id": "baseline"}]
+    scenarios += [{"id": f"loop-{s}", "loop_stations": [s]} for s in range(NUM_STATIONS)]
+    scenarios += [{"id": f"speed-{b}", "speed_up_blocks": {b: 1.25}} for b in range(NUM_BLOCKS)]
+    return scenarios
+
+
+def scenario_kwargs(scenario):
+    """run_sim kwargs of a scenario spec (run_sim kwargs + "id")."""
+    kwargs = {k: v for k, v in scenario.items() if k != "id"}
+    # JSON object keys arrive as strings
+    for key in ("speed_up_blocks", "block_capacities"):
+        if kwargs.get(key):
+            kwargs[key] = {int(b): v for b, v in kwargs[key].items()}
+    return kwargs
+
+
+def kpi_summary(result):
+    """KPI dict of a run_sim result tuple."""
+    (_, sim_time, block_wait, block_usage, station_wait, station_usage,
+     freight_finished, avg_frt_time, avg_frt_speed) = result
+
+    return {
+        "simulation_time": sim_time,
+        "block_wait_time": block_wait,
+        "block_usage": block_usage,
+        "station_usage": station_usage,
+        "freight_finished": int(freight_finished),
+        "avg_freight_travel_time": float(avg_frt_time),
+        "avg_freight_speed": float(avg_frt_speed),
+    }
+
+
+def run_scenario(scenario):
+    """Run one scenario spec (run_sim kwargs + "id") and return its KPI summary."""
+    from sim import run_sim
+
+    kwargs = scenario_kwargs(scenario)
+    kwargs.setdefault("kpi_only", True)  # summaries only: no trajectories needed
+    with contextlib.redirect_stdout(io.StringIO()):
+        return kpi_summary(run_sim(scenario["id"], **kwargs))
+
+
+# ===================== WORK QUEUE =====================
+
+class SweepQueue:
+    """Thread-safe chunk queue with leases, retries and result de-duplication."""
+
+    def __init__(self, scenarios, chunk_size=CHUNK_SIZE, lease_timeout=LEASE_TIMEOUT_SEC,
+                 max_attempts=MAX_ATTEMPTS):
+        ids = [s["id"] for s in scenarios]
+        if len(set(ids)) != len(ids):
+            raise ValueError("scenario ids must be unique")
+
+        self.lease_timeout = lease_timeout
+        self.max_attempts = max_attempts
+        self.total = len(scenarios)
+        self.results = {}
+        self.failed = {}
+
+        self._lock = threading.Condition()
+        self._chunks = {}
+        self._pending = deque()
+        self._leases = {}      # chunk_id -> (worker, deadline)
+        self._attempts = {}
+        self._workers = set()
+        self._started = time.monotonic()
+
+        for n, i in enumerate(range(0, len(scenarios), chunk_size)):
+            self._chunks[n] = scenarios[i:i + chunk_size]
+            self._attempts[n] = 0
+            self._pending.append(n)
+
+    # ---------- worker side ----------
+    def lease(self, worker):
+        """Next chunk as (chunk_id, scenarios); None once everything is settled."""
+        with self._lock:
+            self._workers.add(worker)
+            while True:
+                self._expire_leases()
+                while self._pending:
+                    cid = self._pending.popleft()
+                    if self._chunk_settled(cid):
+                        continue
+                    self._attempts[cid] += 1
+                    self._leases[cid] = (worker, time.monotonic() + self.lease_timeout)
+                    return cid, self._chunks[cid]
+                if not self._leases:
+                    return None
+                # other workers still hold chunks: wait for them (or their expiry)
+                self._lock.wait(timeout=1.0)
+
+    def complete(self, worker, cid, results):
+        """results: {scenario id: KPI dict | {"error": message}}."""
+        with self._lock:
+            for sid, kpis in results.items():
+                if "error" in kpis:
+                    # a scenario that raises fails the same way on every worker: no retry
+                    if sid not in self.results:
+                        self.failed.setdefault(sid, kpis["error"])
+                else:
+                    self.results.setdefault(sid, kpis)  # first copy wins
+                    self.failed.pop(sid, None)
+            if self._leases.get(cid, (None,))[0] == worker:
+                del self._leases[cid]
+            self._lock.notify_all()
+
+    def release(self, worker):
+        """Worker lost: put everything it held back on the queue."""
+        with self._lock:
+            self._workers.discard(worker)
+            for cid, (w, _) in list(self._leases.items()):
+                if w == worker:
+                    del self._leases[cid]
+                    self._retry(cid, f"worker {worker} lost")
+            self._lock.notify_all()
+
+    def abandon(self, reason):
+        """No workers left: fail everything that has not settled."""
+        with self._lock:
+            for chunk in self._chunks.values():
+                for s in chunk:
+                    if s["id"] not in self.results:
+                        self.failed.setdefault(s["id"], reason)
+            self._pending.clear()
+            self._leases.clear()
+            self._lock.notify_all()
+
+    # ---------- internals (lock held) ----------
+    def _chunk_settled(self, cid):
+        return all(s["id"] in self.results or s["id"] in self.failed for s in self._chunks[cid])
+
+    def _retry(self, cid, reason):
+        if self._chunk_settled(cid):
+            return
+        if self._attempts[cid] >= self.max_attempts:
+            for s in self._chunks[cid]:
+                if s["id"] not in self.results:
+                    self.failed[s["id"]] = reason
+        else:
+            self._pending.append(cid)
+
+    def _expire_leases(self):
+        now = time.monotonic()
+        for cid, (w, deadline) in list(self._leases.items()):
+            if deadline < now:
+                del self._leases[cid]
+                self._retry(cid, f"lease expired on worker {w}")
+
+    # ---------- progress ----------
+    def done(self):
+        with self._lock:
+            return len(self.results) + len(self.failed) >= self.total
+
+    def wait(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            while len(self.results) + len(self.failed) < self.total:
+                left = None if deadline is None else deadline - time.monotonic()
+                if left is not None and left <= 0:
+                    return False
+                self._lock.wait(timeout=1.0 if left is None else min(left, 1.0))
+                self._expire_leases()
+            return True
+
+    def progress(self):
+        with self._lock:
+            elapsed = time.monotonic() - self._started
+            done = len(self.results)
+            return {
+                "total": self.total,
+                "done": done,
+                "failed": len(self.failed),
+                "in_flight_chunks": len(self._leases),
+                "workers": len(self._workers),
+                "elapsed_sec": round(elapsed, 2),
+                "scenarios_per_sec": round(done / elapsed, 3) if elapsed > 0 else 0.0,
+            }
+
+
+# ===================== TRANSPORT =====================
+
+class JsonConnection:
+    """send/recv of JSON messages over a TCP socket (same interface as a multiprocessing Connection)."""
+
+    def __init__(self, sock):
+        self.sock = sock
+
+    def send(self, msg):
+        data = json.dumps(msg).encode()
+        self.sock.sendall(_HEADER.pack(len(data)) + data)
+
+    def recv(self):
+        (size,) = _HEADER.unpack(self._read(_HEADER.size))
+        return json.loads(self._read(size))
+
+    def _read(self, n):
+        buf = bytearray()
+        while len(buf) < n:
+            part = self.sock.recv(n - len(buf))
+            if not part:
+                raise EOFError("connection closed")
+            buf += part
+        return bytes(buf)
+
+    def close(self):
+        self.sock.close()
+
+
+def serve_connection(queue, conn, worker):
+    """Coordinator side of one worker connection (TCP or pipe)."""
+    try:
+        while True:
+            msg = conn.recv()
+            if msg["type"] == "result":
+                queue.complete(worker, msg["chunk_id"], msg["results"])
+            elif msg["type"] != "ready":
+                raise ValueError(f"unexpected message {msg['type']!r}")
+
+            job = queue.lease(worker)
+            if job is None:
+                conn.send({"type": "done"})
+                return
+            cid, scenarios = job
+            conn.send({"type": "chunk", "chunk_id": cid, "scenarios": scenarios})
+    except (EOFError, OSError, ValueError, KeyError):
+        pass
+    finally:
+        queue.release(worker)
+
+
+def worker_loop(conn):
+    """Worker side: pull chunks until the coordinator says done."""
+    conn.send({"type": "ready"})
+    while True:
+        msg = conn.recv()
+        if msg["type"] == "done":
+            return
+        results = {}
+        for s in msg["scenarios"]:
+            try:
+                results[s["id"]] = run_scenario(s)
+            except Exception as e:
+                # report it and keep serving: one bad scenario must not take the worker down
+                results[s["id"]] = {"error": f"{type(e).__name__}: {e}"}
+        conn.send({"type": "result", "chunk_id": msg["chunk_id"], "results": results})
+
+
+# ===================== TCP COORDINATOR / WORKER =====================
+
+def serve_tcp(queue, host="0.0.0.0", port=5555):
+    """Accept workers in a background thread; returns the listening socket."""
+    srv = socket.create_server((host, port), reuse_port=False)
+    srv.settimeout(1.0)
+
+    def accept_loop():
+        n = 0
+        while not queue.done():
+            try:
+                sock, addr = srv.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                return
+            n += 1
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            worker = f"{addr[0]}:{addr[1]}#{n}"
+            threading.Thread(target=serve_connection, args=(queue, JsonConnection(sock), worker),
+                             daemon=True).start()
+        srv.close()
+
+    threading.Thread(target=accept_loop, name="sweep-accept", daemon=True).start()
+    return srv
+
+
+def connect_worker(host, port, retries=50):
+    for _ in range(retries):
+        try:
+            sock = socket.create_connection((host, port))
+            break
+        except OSError:
+            time.sleep(0.2)
+    else:
+        raise ConnectionError(f"cannot reach coordinator at {host}:{port}")
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    conn = JsonConnection(sock)
+    try:
+        worker_loop(conn)
+    except EOFError:
+        pass
+    finally:
+        conn.close()
+
+
+# ===================== LOCAL BROKER =====================
+
+def _stop_workers(procs, join, terminate):
+    """Wait for local workers; terminate (then kill) the ones still running."""
+    deadline = time.monotonic() + WORKER_EXIT_TIMEOUT_SEC
+    for p in procs:
+        if not join(p, max(0.0, deadline - time.monotonic())):
+            terminate(p)
+
+
+def run_local_pipes(scenarios, workers=2, chunk_size=CHUNK_SIZE, lease_timeout=LEASE_TIMEOUT_SEC):
+    """Same coordinator logic over multiprocessing pipes instead of TCP."""
+    import multiprocessing as mp
+
+    queue = SweepQueue(scenarios, chunk_size=chunk_size, lease_timeout=lease_timeout)
+    procs = []
+    for n in range(workers):
+        parent, child = mp.Pipe()
+        p = mp.Process(target=worker_loop, args=(child,), daemon=True)
+        p.start()
+        procs.append(p)
+        threading.Thread(target=serve_connection, args=(queue, parent, f"pipe#{n}"),
+                         daemon=True).start()
+    while not queue.wait(timeout=1.0):
+        if not any(p.is_alive() for p in procs):
+            queue.abandon("all workers exited")
+            break
+
+    def join(p, timeout):
+        p.join(timeout)
+        return not p.is_alive()
+
+    def terminate(p):
+        p.terminate()
+        p.join(1.0)
+        if p.is_alive():
+            p.kill()
+            p.join()
+
+    _stop_workers(procs, join, terminate)
+    return queue
+
+
+def run_local_tcp(scenarios, workers=2, port=0, chunk_size=CHUNK_SIZE, on_progress=None,
+                  lease_timeout=LEASE_TIMEOUT_SEC):
+    """Coordinator in this process + `workers` local worker processes over TCP."""
+    queue = SweepQueue(scenarios, chunk_size=chunk_size, lease_timeout=lease_timeout)
+    srv = serve_tcp(queue, "127.0.0.1", port)
+    port = srv.getsockname()[1]
+
+    procs = [
+        subprocess.Popen([sys.executable, __file__, "worker", "--connect", f"127.0.0.1:{port}"])
+        for _ in range(workers)
+    ]
+    while not queue.wait(timeout=2.0):
+        if on_progress:
+            on_progress(queue.progress())
+        if all(p.poll() is not None for p in procs):
+            queue.abandon("all workers exited")
+            break
+
+    def join(p, timeout):
+        try:
+            p.wait(timeout=timeout)
+            return True
+        except subprocess.TimeoutExpired:
+            return False
+
+    def terminate(p):
+        p.terminate()
+        try:
+            p.wait(timeout=1.0)
+        except subprocess.TimeoutExpired:
+            p.kill()
+            p.wait()
+
+    _stop_workers(procs, join, terminate)
+    return queue
+
+
+# ===================== CLI =====================
+
+def _load_scenarios(path):
+    if not path:
+        return default_sweep()
+    with open(path) as f:
+        return json.load(f)
+
+
+def _print_progress(p):
+    print(f"⏳ {p['done']}/{p['total']} done, {p['failed']} failed, "
+          f"{p['workers']} workers, {p['scenarios_per_sec']} scen/s")
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Distributed run_sim scenario sweeps")
+    sub = ap.add_subparsers(dest="mode", required=True)
+
+    c = sub.add_parser("coordinator")
+    c.add_argument("--host", default="0.0.0.0")
+    c.add_argument("--port", type=int, default=5555)
+    c.add_argument("--scenarios", help="JSON list of scenarios (default: single-change sweep)")
+    c.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    c.add_argument("--lease-timeout", type=float, default=LEASE_TIMEOUT_SEC)
+    c.add_argument("--out", default="sweep_results.json")
+
+    w = sub.add_parser("worker")
+    w.add_argument("--connect", required=True, help="host:port of the coordinator")
+
+    loc = sub.add_parser("local")
+    loc.add_argument("--workers", type=int, default=2)
+    loc.add_argument("--scenarios")
+    loc.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    loc.add_argument("--lease-timeout", type=float, default=LEASE_TIMEOUT_SEC)
+    loc.add_argument("--out", default="sweep_results.json")
+
+    args = ap.parse_args(argv)
+
+    if args.mode == "worker":
+        host, port = args.connect.rsplit(":", 1)
+        connect_worker(host, int(port))
+        return
+
+    scenarios = _load_scenarios(args.scenarios)
+    if args.mode == "coordinator":
+        queue = SweepQueue(scenarios, chunk_size=args.chunk_size, lease_timeout=args.lease_timeout)
+        serve_tcp(queue, args.host, args.port)
+        print(f"🛰 Coordinator on {args.host}:{args.port}, {len(scenarios)} scenarios")
+        while not queue.wait(timeout=5.0):
+            _print_progress(queue.progress())
+    else:
+        queue = run_local_tcp(scenarios, args.workers, chunk_size=args.chunk_size,
+                              on_progress=_print_progress, lease_timeout=args.lease_timeout)
+
+    _print_progress(queue.progress())
+    with open(args.out, "w") as f:
+        json.dump({"results": queue.results, "failed": queue.failed,
+                   "progress": queue.progress()}, f)
+    print(f"📦 Results written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
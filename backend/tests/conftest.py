@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# the backend modules are top-level imports (run from backend/, like uvicorn)
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
@@ -0,0 +1,99 @@
+"""
+Block snapshot invalidation (app.infra_cache) against a local SQLite file:
+committed writes drop the snapshot, rolled-back ones don't, and a session
+with uncommitted block writes reads its own rows without caching them.
+"""
+import asyncio
+import os
+import tempfile
+
+import pytest
+
+# app.db binds its engines to DATABASE_URL at import
+_DB_DIR = tempfile.mkdtemp(prefix="infra-cache-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_DB_DIR}/infra.db")
+
+from sqlalchemy import delete, text, update  # noqa: E402
+
+from app import infra_cache  # noqa: E402
+from app.db import AsyncSessionLocal, SessionLocal, engine, init_db  # noqa: E402
+from app.models.infra import Block  # noqa: E402
+
+pytestmark = pytest.mark.skipif(
+    not engine.url.drivername.startswith("sqlite") or "infra-cache-" not in str(engine.url),
+    reason="app.db was already bound to another database",
+)
+
+
+def lengths():
+    return infra_cache.block_lengths()
+
+
+@pytest.fixture(autouse=True)
+def blocks():
+    init_db()
+    with SessionLocal() as db:
+        db.execute(delete(Block))
+        db.add_all([Block(id=i, station_from=f"S{i}", station_to=f"S{i + 1}", distance_km=10.0)
+                    for i in range(3)])
+        db.commit()
+    lengths()  # warm
+    yield
+
+
+def test_orm_write_invalidates_on_commit_not_flush():
+    with SessionLocal() as db:
+        db.get(Block, 0).distance_km = 12.5
+        db.flush()
+        assert lengths() == (10.0, 10.0, 10.0)  # flushed, not committed
+        db.commit()
+    assert lengths() == (12.5, 10.0, 10.0)
+
+
+def test_bulk_update_invalidates_on_commit():
+    with SessionLocal() as db:
+        db.execute(update(Block).values(distance_km=7.0))
+        assert lengths() == (10.0, 10.0, 10.0)
+        db.commit()
+    assert lengths() == (7.0, 7.0, 7.0)
+
+
+def test_async_write_invalidates_on_commit():
+    async def write():
+        async with AsyncSessionLocal() as db:
+            db.add(Block(id=3, station_from="S3", station_to="S4", distance_km=4.0))
+            await db.commit()
+            return await infra_cache.get_snapshot_async(db)
+
+    snap = asyncio.run(write())
+    assert snap.block_lengths == (10.0, 10.0, 10.0, 4.0)
+    assert lengths() == (10.0, 10.0, 10.0, 4.0)
+
+
+def test_rollback_keeps_snapshot():
+    before = infra_cache.get_snapshot()
+    with SessionLocal() as db:
+        db.add(Block(id=3, station_from="S3", station_to="S4", distance_km=4.0))
+        db.flush()
+        db.rollback()
+    assert infra_cache.get_snapshot() is before
+
+
+def test_session_reads_own_uncommitted_rows_without_caching_them():
+    with SessionLocal() as db:
+        db.add(Block(id=3, station_from="S3", station_to="S4", distance_km=4.0))
+        db.flush()
+        assert infra_cache.get_snapshot(db).block_lengths == (10.0, 10.0, 10.0, 4.0)
+        # other readers still get the committed snapshot
+        assert lengths() == (10.0, 10.0, 10.0)
+        db.rollback()
+    assert lengths() == (10.0, 10.0, 10.0)
+
+
+def test_core_writes_need_explicit_invalidate():
+    # documented limitation: Core connections bypass the Session events
+    with engine.begin() as conn:
+        conn.execute(text("UPDATE blocks SET distance_km = 1.0"))
+    assert lengths() == (10.0, 10.0, 10.0)
+    infra_cache.invalidate()
+    assert lengths() == (1.0, 1.0, 1.0)
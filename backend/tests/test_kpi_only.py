@@ -0,0 +1,54 @@
+"""
+run_sim(kpi_only=True) keeps online accumulators instead of the trajectory
+DataFrame; its KPIs must match the full run bit for bit.
+"""
+import contextlib
+import io
+import random
+
+import pytest
+
+import sim
+from timetable import StreamCompiler
+
+
+def _timetable(trains=150, seed=7):
+    rng = random.Random(seed)
+    lines = ["train_id,type,departure,from,to"]
+    for i in range(trains):
+        ttype = rng.choice(("EXP", "LOC", "FRT"))
+        a, b = rng.sample(sim.STATION_CODES, 2)
+        if ttype == "FRT":
+            # end to end, so freight completion / speed are exercised too
+            a, b = rng.choice(((sim.STATION_CODES[0], sim.STATION_CODES[-1]),
+                               (sim.STATION_CODES[-1], sim.STATION_CODES[0])))
+        lines.append(f"{i},{ttype},{rng.uniform(0, sim.DAY_HOURS):.3f},{a},{b}")
+    c = StreamCompiler("csv")
+    c.feed("\n".join(lines) + "\n")
+    return c.close()
+
+
+SCENARIOS = {
+    "baseline": {},
+    "loops": {"loop_stations": [5, 10, 12, 13]},
+    "new_line": {"new_track_direction": "UP"},
+    "signals": {"auto_blocks": [1, 2, 3, 4], "signal_spacing_km": 2.0},
+    "timetable": {"timetable": _timetable()},
+    "timetable_delayed": {"timetable": _timetable(), "mean_departure_delay": 0.1, "seed": 3},
+}
+
+
+def _exact(kpis):
+    """float.hex of every KPI value: bit-level equality, and nan equals nan."""
+    return [[float(x).hex() for x in v] if isinstance(v, list) else float(v).hex() for v in kpis]
+
+
+@pytest.mark.parametrize("name", SCENARIOS)
+def test_kpi_only_matches_full_run(name):
+    kwargs = SCENARIOS[name]
+    with contextlib.redirect_stdout(io.StringIO()):
+        full = sim.run_sim(name, **kwargs)
+        fast = sim.run_sim(name, kpi_only=True, **kwargs)
+
+    assert fast[0] is None
+    assert _exact(fast[1:]) == _exact(full[1:])
@@ -0,0 +1,22 @@
+"""Trajectories written by pool workers into shared buffers match a direct run."""
+import contextlib
+import io
+
+import numpy as np
+
+import sim
+from replication import replicate
+
+
+def test_replicate_trajectories_match_run_sim():
+    scenarios = [{"id": "baseline"}, {"id": "loop", "loop_stations": [10]}]
+    out = replicate(scenarios, reps=2, workers=2, trajectories=True)
+
+    for s in scenarios:
+        kwargs = {k: v for k, v in s.items() if k != "id"}
+        assert sorted(out["trajectories"][s["id"]]) == out["seeds"]
+        for seed, frame in out["trajectories"][s["id"]].items():
+            with contextlib.redirect_stdout(io.StringIO()):
+                df = sim.run_sim(s["id"], seed=seed, **kwargs)[0]
+            for col in ("train", "time", "dist"):
+                assert np.array_equal(frame[col].to_numpy(), df[col].to_numpy())
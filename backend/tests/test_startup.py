@@ -0,0 +1,43 @@
+"""
+Cold-start budget of the API module.
+
+`import api` runs in a fresh interpreter, as a uvicorn worker would, and
+must stay under IMPORT_BUDGET_S without pulling in the heavy modules that
+only the simulation / chart paths need.
+"""
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+BACKEND = Path(__file__).resolve().parents[1]
+# ~0.5 s today; the eager pandas/matplotlib import took ~1.3 s
+IMPORT_BUDGET_S = float(os.environ.get("API_IMPORT_BUDGET_S", "1.0"))
+LAZY_MODULES = ("pandas", "matplotlib")
+
+PROBE = f"""
+import json, sys, time
+t = time.perf_counter()
+import api
+elapsed = time.perf_counter() - t
+print(json.dumps({{"elapsed": elapsed,
+                  "loaded": [m for m in {LAZY_MODULES!r} if m in sys.modules]}}))
+"""
+
+
+def _import_api():
+    env = dict(os.environ, SIM_WARMUP="0", SIM_CORRIDOR_FROM_DB="0")
+    out = subprocess.run([sys.executable, "-c", PROBE], cwd=BACKEND, env=env,
+                         capture_output=True, text=True, timeout=60, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def test_import_api_within_budget():
+    probe = _import_api()
+    assert probe["elapsed"] < IMPORT_BUDGET_S, \
+        f"import api took {probe['elapsed']:.2f}s (budget {IMPORT_BUDGET_S}s)"
+
+
+def test_import_api_keeps_heavy_modules_lazy():
+    assert _import_api()["loaded"] == []
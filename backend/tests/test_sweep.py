@@ -0,0 +1,116 @@
+"""
+SweepQueue leases, retries and de-duplication, on their own and through
+real local worker processes (pipes and TCP) on this host.
+"""
+import multiprocessing
+import os
+import subprocess
+import time
+from pathlib import Path
+
+import pytest
+
+import sweep
+from sweep import SweepQueue
+
+
+# ---------- queue only ----------
+
+def test_expired_lease_is_requeued_and_first_result_wins():
+    q = SweepQueue([{"id": "a"}, {"id": "b"}], chunk_size=2, lease_timeout=0.05)
+    assert q.lease("w1")[0] == 0
+    time.sleep(0.1)
+    assert q.lease("w2")[0] == 0  # w1's lease expired
+
+    q.complete("w2", 0, {"a": {"v": 2}, "b": {"v": 2}})
+    q.complete("w1", 0, {"a": {"v": 1}, "b": {"v": 1}})  # late duplicate
+    assert q.results == {"a": {"v": 2}, "b": {"v": 2}}
+    assert q.done() and q.lease("w3") is None
+
+
+def test_lost_worker_chunk_goes_back_until_max_attempts():
+    q = SweepQueue([{"id": "a"}], chunk_size=1, max_attempts=2)
+    q.lease("w1")
+    q.release("w1")
+    q.lease("w2")
+    q.release("w2")
+    assert q.failed == {"a": "worker w2 lost"}
+    assert q.lease("w3") is None
+
+
+def test_scenario_error_is_not_retried():
+    q = SweepQueue([{"id": "a"}, {"id": "b"}], chunk_size=2)
+    q.lease("w1")
+    q.complete("w1", 0, {"a": {"v": 1}, "b": {"error": "ValueError: bad"}})
+    assert q.results == {"a": {"v": 1}}
+    assert q.failed == {"b": "ValueError: bad"}
+    assert q.lease("w1") is None
+
+
+# ---------- local worker processes ----------
+
+def _flaky_scenario(scenario):
+    """Crashes or stalls the first worker to run a marked scenario; retries run normally."""
+    marker = Path(os.environ["SWEEP_TEST_DIR"]) / scenario["id"]
+    first = not marker.exists()
+    marker.touch()
+    if first and scenario.get("crash"):
+        os._exit(1)
+    if first and scenario.get("stall"):
+        time.sleep(2.0)
+    return {"attempt": "first" if first else "retry"}
+
+
+fork_only = pytest.mark.skipif(multiprocessing.get_start_method() != "fork",
+                               reason="workers inherit the patched run_scenario through fork")
+
+
+@pytest.fixture
+def flaky(monkeypatch, tmp_path):
+    monkeypatch.setenv("SWEEP_TEST_DIR", str(tmp_path))
+    monkeypatch.setattr(sweep, "run_scenario", _flaky_scenario)
+
+
+@fork_only
+def test_pipes_requeue_chunk_of_killed_worker(flaky):
+    scenarios = [{"id": "a"}, {"id": "crash", "crash": True}, {"id": "c"}]
+    q = sweep.run_local_pipes(scenarios, workers=2, chunk_size=1)
+
+    assert q.failed == {}
+    assert set(q.results) == {"a", "crash", "c"}
+    assert q.results["crash"] == {"attempt": "retry"}
+
+
+@fork_only
+def test_pipes_requeue_expired_lease_and_drop_late_duplicate(flaky):
+    scenarios = [{"id": "stall", "stall": True}, {"id": "b"}]
+    q = sweep.run_local_pipes(scenarios, workers=2, chunk_size=1, lease_timeout=0.3)
+
+    # the retry settles the chunk; the stalled first copy arrives later and is dropped
+    assert q.failed == {}
+    assert q.results["stall"] == {"attempt": "retry"}
+    assert q.progress()["done"] == 2
+
+
+def test_tcp_coordinator_stops_workers_still_running_expired_chunks(monkeypatch):
+    # chunks: 4 scenarios and 1 scenario, leases far shorter than either. The
+    # worker done with the short chunk re-runs the long one (lease expired),
+    # and is still busy when the original copy settles the sweep
+    monkeypatch.setattr(sweep, "WORKER_EXIT_TIMEOUT_SEC", 0.01)
+    procs = []
+
+    class Popen(subprocess.Popen):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            procs.append(self)
+
+    monkeypatch.setattr(sweep.subprocess, "Popen", Popen)
+    scenarios = [{"id": f"loop-{s}", "loop_stations": [s]} for s in range(5)]
+
+    q = sweep.run_local_tcp(scenarios, workers=2, chunk_size=4, lease_timeout=0.05)
+
+    assert q.failed == {}
+    assert set(q.results) == {s["id"] for s in scenarios}
+    # all reaped, and the one still on its retry was stopped rather than awaited
+    assert all(p.returncode is not None for p in procs)
+    assert any(p.returncode < 0 for p in procs)
@@ -0,0 +1,52 @@
+"""Timetable input validation: every bad input is a TimetableError (HTTP 400)."""
+import pytest
+
+from timetable import MAX_DEPARTURE_HOURS, StreamCompiler, TimetableError, parse_hours
+
+HEADER = "train_id,type,departure,from,to\n"
+
+
+def compile_text(text, fmt="csv"):
+    c = StreamCompiler(fmt)
+    c.feed(text)
+    return c.close()
+
+
+def test_parse_hours_accepts_clock_and_decimal():
+    assert parse_hours("06:15") == 6.25
+    assert parse_hours("25:00:36") == 25.01
+    assert parse_hours("6.5") == 6.5
+
+
+@pytest.mark.parametrize("value", ["-0:30", "-1:00", "+1:00", "25:99", "1:00:60", "inf", "nan", "1:nan"])
+def test_parse_hours_rejects(value):
+    with pytest.raises(ValueError):
+        parse_hours(value)
+
+
+@pytest.mark.parametrize("departure", ["1e300", "-0:30", "-0.5", f"{MAX_DEPARTURE_HOURS + 1:g}", "9999:00"])
+def test_departure_out_of_range_is_rejected(departure):
+    with pytest.raises(TimetableError):
+        compile_text(HEADER + f"1,EXP,{departure},KTV,PSA\n")
+
+
+def test_departure_at_bound_is_accepted():
+    tt = compile_text(HEADER + f"1,EXP,{MAX_DEPARTURE_HOURS:g},KTV,PSA\n")
+    assert float(tt.dep[0]) == MAX_DEPARTURE_HOURS
+
+
+@pytest.mark.parametrize("text,fmt", [
+    ("[1,2]\n", "jsonl"),
+    ('"EXP"\n', "jsonl"),
+    ('{"a": 1}', "json"),
+    ("[1]", "json"),
+    ("[", "json"),
+])
+def test_non_object_json_is_rejected(text, fmt):
+    with pytest.raises(TimetableError):
+        compile_text(text, fmt)
+
+
+def test_json_array_of_objects_compiles():
+    tt = compile_text('[{"type": "EXP", "departure": "06:00", "from": "KTV", "to": "PSA"}]', "json")
+    assert len(tt) == 1
@@ -0,0 +1,112 @@
+"""
+Level-of-detail distance-time tiles.
+
+The time axis is cut into a fixed grid per zoom level: at zoom z a tile
+spans TILE_BASE_HOURS / 2**z hours and tile x covers [x * span, (x + 1) * span).
+Each tile is resolved to TILE_BINS time buckets:
+
+- "lines":   per-train polylines decimated to at most the first/last vertex
+             of every bucket a train passes through
+- "density": when more than TILE_MAX_TRAINS trains cross the tile, a
+             (time bucket x distance bucket) count of trains on the line
+"""
+import numpy as np
+
+from sim import station_pos
+
+TILE_BASE_HOURS = 32.0
+TILE_BINS = 256
+TILE_DIST_BINS = 64
+TILE_MAX_TRAINS = 400
+MAX_ZOOM = 8
+
+
+def tile_span(zoom):
+    return TILE_BASE_HOURS / (2 ** zoom)
+
+
+def build_tile(traj, zoom, x):
+    if not (0 <= zoom <= MAX_ZOOM) or x < 0:
+        raise ValueError(f"tile ({zoom}, {x}) out of range")
+
+    span = tile_span(zoom)
+    t0 = x * span
+    if t0 > traj.t_max:
+        raise ValueError(f"tile ({zoom}, {x}) starts at {t0:g}h, past the run horizon ({traj.t_max:.2f}h)")
+    t1 = t0 + span
+    res = span / TILE_BINS
+
+    tile = {"zoom": zoom, "x": x, "t_start": t0, "t_end": t1}
+
+    starts = traj.time[traj.offsets[:-1]]
+    ends = traj.time[traj.offsets[1:] - 1]
+    active = np.flatnonzero((starts < t1) & (ends >= t0))
+
+    if len(active) > TILE_MAX_TRAINS:
+        tile["mode"] = "density"
+        tile.update(_density(traj, active, t0, res))
+        return tile
+
+    tile["mode"] = "lines"
+    tile["trains"] = _decimated_lines(traj, active, t0, t1, res)
+    return tile
+
+
+def _decimated_lines(traj, active, t0, t1, res):
+    time, dist, owner = traj.time, traj.dist, traj.train_of_row
+    n = len(time)
+
+    in_win = (time >= t0) & (time < t1)
+    # keep the vertex just outside each edge so lines run to the tile border
+    keep = in_win.copy()
+    keep[:-1] |= in_win[1:] & (owner[:-1] == owner[1:])
+    keep[1:] |= in_win[:-1] & (owner[1:] == owner[:-1])
+
+    # decimate: inside one bucket only the first and last vertex of a train survive
+    bucket = np.floor((time - t0) / res).astype(np.int64)
+    new_run = np.ones(n, dtype=bool)
+    new_run[1:] = (bucket[1:] != bucket[:-1]) | (owner[1:] != owner[:-1])
+    end_run = np.ones(n, dtype=bool)
+    end_run[:-1] = new_run[1:]
+    keep &= new_run | end_run | ~in_win
+
+    active_set = np.zeros(len(traj), dtype=bool)
+    active_set[active] = True
+    keep &= active_set[owner]
+
+    rows = np.flatnonzero(keep)
+    cuts = np.flatnonzero(np.diff(owner[rows])) + 1
+    trains = []
+    for chunk in np.split(rows, cuts):
+        if len(chunk) == 0:
+            continue
+        k = owner[chunk[0]]
+        trains.append({
+            "train_id": f"T{int(traj.train_ids[k])}",
+            "color": str(traj.colors[k]),
+            "t": np.round(time[chunk], 4).tolist(),
+            "d": np.round(dist[chunk], 3).tolist(),
+        })
+    return trains
+
+
+def _density(traj, active, t0, res):
+    centers = t0 + (np.arange(TILE_BINS) + 0.5) * res
+    d_edges = np.linspace(0.0, station_pos[-1], TILE_DIST_BINS + 1)
+    counts = np.zeros((TILE_BINS, TILE_DIST_BINS), dtype=np.int64)
+
+    for k in active:
+        lo, hi = traj.offsets[k], traj.offsets[k + 1]
+        t = traj.time[lo:hi]
+        on = (centers >= t[0]) & (centers <= t[-1])
+        if not on.any():
+            continue
+        pos = np.interp(centers[on], t, traj.dist[lo:hi])
+        d_bin = np.clip(np.searchsorted(d_edges, pos, side="right") - 1, 0, TILE_DIST_BINS - 1)
+        np.add.at(counts, (np.flatnonzero(on), d_bin), 1)
+
+    return {
+        "time_bins": np.round(centers, 4).tolist(),
+        "dist_edges": np.round(d_edges, 3).tolist(),
+        "counts": counts.tolist(),
+    }
@@ -0,0 +1,385 @@
+"""
+Streaming loader for real working timetables.
+
+One row per train, CSV (with header) or JSON Lines / JSON array:
+
+    train_id,type,departure,from,to,stops,priority,direction
+    12727,EXP,06:15,KTV,PSA,VZM;DUSI;NWP,0,UP
+    FRT-88,FRT,6.5,PSA,KTV,,2,
+
+- type:       EXP | LOC | FRT
+- departure:  hours (6.5) or HH:MM[:SS], at most MAX_DEPARTURE_HOURS
+- from / to:  station code (KTV) or index (0)
+- stops:      optional ";"-separated station codes/indices where the train
+              dwells (origin and destination are always stops)
+- priority:   optional, lower = served first (default 0 passenger, 2 freight)
+- direction:  optional, must agree with from/to if given
+- speed:      optional km/h (default by type)
+
+Rows are validated and appended to typed arrays one at a time; no
+intermediate DataFrame or list of row dicts is built. Passenger trains are
+numbered before freights in the compiled timetable, matching how the
+synthetic timetable numbers them.
+"""
+import csv
+import json
+import math
+from array import array
+from functools import lru_cache
+from operator import itemgetter
+
+import numpy as np
+
+from sim import (
+    STATION_CODES, NUM_STATIONS, MAJOR_STATIONS, DAY_HOURS,
+    SPEED_EXPRESS, SPEED_LOCAL, SPEED_FRT_LOADED,
+)
+
+TYPE_CODES = {"EXP": 0, "LOC": 1, "FRT": 2}
+FRT = TYPE_CODES["FRT"]
+TYPE_NAMES = ("EXP", "LOC", "FRT")
+TYPE_SPEEDS = (SPEED_EXPRESS, SPEED_LOCAL, SPEED_FRT_LOADED)
+
+# a timetable is one operating day; allow departures running into later days
+MAX_DEPARTURE_HOURS = 3 * DAY_HOURS
+
+_STATION_INDEX = {code: i for i, code in enumerate(STATION_CODES)}
+_STATION_INDEX.update({str(i): i for i in range(NUM_STATIONS)})
+
+_MAJOR_MASK = 0
+for _s in MAJOR_STATIONS:
+    _MAJOR_MASK |= 1 << _s
+
+
+class TimetableError(ValueError):
+    def __init__(self, row, msg):
+        super().__init__(f"row {row}: {msg}")
+        self.row = row
+
+
+@lru_cache(maxsize=8192)
+def parse_hours(value):
+    """Hours (6.5) or HH:MM[:SS] -> finite float hours; ValueError otherwise."""
+    value = value.strip()
+    if ":" in value:
+        parts = value.split(":")
+        # digits only: int() would read "-0" as 0 and "-0:30" as +0.5 h
+        if len(parts) not in (2, 3) or not parts[0].strip().isdigit():
+            raise ValueError(value)
+        h, m = int(parts[0]), int(parts[1])
+        s = float(parts[2]) if len(parts) == 3 else 0.0
+        # float() also takes "nan" / "inf" for the seconds; the range check rejects them
+        if not (0 <= m <= 59 and 0 <= s < 60):
+            raise ValueError(value)
+        return h + m / 60.0 + s / 3600.0
+    hours = float(value)
+    if not math.isfinite(hours):
+        raise ValueError(value)
+    return hours
+
+
+def station_index(token):
+    st = _STATION_INDEX.get(token)
+    if st is None:
+        st = _STATION_INDEX.get(token.strip().upper())
+    return st
+
+
+@lru_cache(maxsize=65536)
+def stop_mask(stops):
+    """"VZM;DUSI;18" -> bitmask; raises KeyError(token) for an unknown station."""
+    mask = 0
+    for tok in stops.replace("|", ";").split(";"):
+        if not tok.strip():
+            continue
+        st = station_index(tok)
+        if st is None:
+            raise KeyError(tok.strip())
+        mask |= 1 << st
+    return mask
+
+
+class Timetable:
+    """
+    Compiled timetable: one entry per train in parallel typed arrays.
+    stop_mask bit s set -> the train dwells at station s.
+    """
+
+    def __init__(self, names, ttype, dep, start_st, end_st, stop_mask, priority, speed):
+        self.names = names
+        self.ttype = ttype
+        self.dep = dep
+        self.start_st = start_st
+        self.end_st = end_st
+        self.stop_mask = stop_mask
+        self.priority = priority
+        self.speed = speed
+        self.is_freight = ttype == FRT
+        self.is_up = end_st > start_st
+        self.num_passenger = int((~self.is_freight).sum())
+
+    def __len__(self):
+        return len(self.dep)
+
+    def train(self, i):
+        """(direction, type, speed, start_st, end_st, is_freight, priority, departure) of train i."""
+        s, e = int(self.start_st[i]), int(self.end_st[i])
+        return ("UP" if e > s else "DOWN", TYPE_NAMES[self.ttype[i]], float(self.speed[i]),
+                s, e, bool(self.is_freight[i]), int(self.priority[i]), float(self.dep[i]))
+
+    def stops(self, i):
+        """Stop pattern of train i as the bool list train_process expects."""
+        m = int(self.stop_mask[i])
+        return [bool((m >> s) & 1) for s in range(NUM_STATIONS)]
+
+    @property
+    def nbytes(self):
+        return sum(a.nbytes for a in (self.ttype, self.dep, self.start_st, self.end_st,
+                                      self.stop_mask, self.priority, self.speed))
+
+
+class TimetableBuilder:
+    """Validates rows and appends them to typed arrays (passengers / freights kept apart)."""
+
+    def __init__(self):
+        self._rows = 0
+        self._cols = {}
+        # per class: 0 = passenger, 1 = freight
+        self._names = ([], [])
+        self._ttype = (array("b"), array("b"))
+        self._dep = (array("d"), array("d"))
+        self._start = (array("b"), array("b"))
+        self._end = (array("b"), array("b"))
+        self._mask = (array("I"), array("I"))
+        self._prio = (array("b"), array("b"))
+        self._speed = (array("f"), array("f"))
+
+    # ---------- input formats ----------
+    FIELDS = ("train_id", "type", "departure", "from", "to",
+              "stops", "priority", "direction", "speed")
+
+    def set_header(self, header):
+        self._cols = {name.strip().lower(): i for i, name in enumerate(header)}
+        for required in ("type", "departure", "from", "to"):
+            if required not in self._cols:
+                raise TimetableError(1, f"missing column {required!r}")
+        # missing optional columns read a trailing "" padded onto each row
+        self._width = len(header)
+        self._pick = itemgetter(*(self._cols.get(f, self._width) for f in self.FIELDS))
+
+    def add_csv_row(self, fields):
+        if len(fields) != self._width:
+            fields = (fields + [""] * self._width)[:self._width]
+        fields.append("")
+        self.add(*self._pick(fields))
+
+    def add_record(self, rec):
+        if not isinstance(rec, dict):
+            row = self._rows + 1
+            raise TimetableError(row, f"expected a JSON object per train, got {type(rec).__name__}")
+
+        def get(name):
+            v = rec.get(name)
+            if v is None:
+                return ""
+            if isinstance(v, list):
+                return ";".join(str(x) for x in v)
+            return str(v)
+
+        self.add(*(get(f) for f in self.FIELDS))
+
+    # ---------- one train ----------
+    def add(self, train_id, ttype, departure, start, end, stops="", priority="",
+            direction="", speed=""):
+        self._rows += 1
+        row = self._rows + 1 if self._cols else self._rows  # +1: CSV header line
+
+        code = TYPE_CODES.get(ttype)
+        if code is None:
+            code = TYPE_CODES.get(ttype.strip().upper())
+            if code is None:
+                raise TimetableError(row, f"unknown train type {ttype!r}")
+        try:
+            dep = parse_hours(departure)
+        except ValueError:
+            raise TimetableError(row, f"bad departure {departure!r}")
+        if not 0 <= dep <= MAX_DEPARTURE_HOURS:
+            raise TimetableError(row, f"departure must be within 0..{MAX_DEPARTURE_HOURS:g} h")
+
+        s = station_index(start)
+        e = station_index(end)
+        if s is None or e is None:
+            raise TimetableError(row, f"unknown station in {start!r} -> {end!r}")
+        if s == e:
+            raise TimetableError(row, "origin and destination are the same station")
+
+        if direction:
+            direction = direction.strip().upper()
+            if direction and direction != ("UP" if e > s else "DOWN"):
+                raise TimetableError(row, f"direction {direction} does not match {start} -> {end}")
+
+        lo, hi = (s, e) if s < e else (e, s)
+        run_mask = ((1 << (hi + 1)) - 1) ^ ((1 << lo) - 1)
+        is_frt = code == FRT
+        if stops:
+            try:
+                mask = stop_mask(stops)
+            except KeyError as err:
+                raise TimetableError(row, f"unknown stop {err.args[0]!r}")
+            if mask & ~run_mask:
+                raise TimetableError(row, f"stops {stops!r} outside {start} -> {end}")
+        elif not is_frt:
+            # no explicit stops: passenger trains stop at major stations on their run
+            mask = _MAJOR_MASK & run_mask
+        else:
+            mask = 0
+        mask |= (1 << s) | (1 << e)
+
+        try:
+            prio = int(priority) if priority else (2 if is_frt else 0)
+            spd = float(speed) if speed else TYPE_SPEEDS[code]
+        except ValueError:
+            raise TimetableError(row, f"bad priority/speed {priority!r}/{speed!r}")
+        if not 0 <= prio <= 100 or spd <= 0:
+            raise TimetableError(row, "priority must be 0..100 and speed > 0")
+
+        k = 1 if is_frt else 0
+        self._names[k].append(train_id or f"R{self._rows}")
+        self._ttype[k].append(code)
+        self._dep[k].append(dep)
+        self._start[k].append(s)
+        self._end[k].append(e)
+        self._mask[k].append(mask)
+        self._prio[k].append(prio)
+        self._speed[k].append(spd)
+
+    def build(self):
+        if self._rows == 0:
+            raise TimetableError(0, "timetable is empty")
+
+        def join(parts, dtype):
+            return np.concatenate([np.frombuffer(p, dtype=dtype) if len(p) else
+                                   np.empty(0, dtype=dtype) for p in parts])
+
+        return Timetable(
+            names=self._names[0] + self._names[1],
+            ttype=join(self._ttype, np.int8),
+            dep=join(self._dep, np.float64),
+            start_st=join(self._start, np.int8),
+            end_st=join(self._end, np.int8),
+            stop_mask=join(self._mask, np.uint32),
+            priority=join(self._prio, np.int8),
+            speed=join(self._speed, np.float32),
+        )
+
+
+# ===================== LOADERS =====================
+
+def compile_lines(lines, fmt="csv"):
+    """
+    Compile an iterable of text lines (file object, generator, ...).
+    fmt: "csv" or "jsonl".
+    """
+    b = TimetableBuilder()
+    if fmt == "csv":
+        reader = csv.reader(lines)
+        header = next(reader, None)
+        if header is None:
+            raise TimetableError(0, "timetable is empty")
+        b.set_header(header)
+        for fields in reader:
+            if fields:
+                b.add_csv_row(fields)
+    elif fmt == "jsonl":
+        for n, line in enumerate(lines, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                rec = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise TimetableError(n, f"invalid JSON ({e.msg})")
+            b.add_record(rec)
+    else:
+        raise ValueError(f"unknown timetable format {fmt!r}")
+    return b.build()
+
+
+def json_records(text):
+    """The train objects of a "json" timetable: the document must be an array."""
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError as e:
+        raise TimetableError(0, f"invalid JSON ({e.msg})")
+    if not isinstance(data, list):
+        raise TimetableError(0, f"expected a JSON array of trains, got {type(data).__name__}")
+    return data
+
+
+def load_timetable(path, fmt=None):
+    """Load a .csv, .jsonl or .json timetable file."""
+    if fmt is None:
+        fmt = path.rsplit(".", 1)[-1].lower()
+
+    with open(path, newline="", encoding="utf-8") as f:
+        if fmt == "json":
+            b = TimetableBuilder()
+            for rec in json_records(f.read()):
+                b.add_record(rec)
+            return b.build()
+        return compile_lines(f, fmt)
+
+
+class StreamCompiler:
+    """
+    Incremental compiler for timetables arriving in chunks (e.g. an HTTP
+    request body): feed(text) any number of times, then close().
+    Only the current partial line is buffered for CSV / JSON Lines.
+    """
+
+    def __init__(self, fmt="csv"):
+        if fmt not in ("csv", "jsonl", "json"):
+            raise ValueError(f"unknown timetable format {fmt!r}")
+        self.fmt = fmt
+        self._builder = TimetableBuilder()
+        self._tail = ""
+        self._line = 0
+        self._chunks = []  # only used for "json" (a JSON array is not streamable)
+
+    def feed(self, text):
+        if self.fmt == "json":
+            self._chunks.append(text)
+            return
+        lines = (self._tail + text).split("\n")
+        self._tail = lines.pop()
+        self._feed_lines(lines)
+
+    def _feed_lines(self, lines):
+        b = self._builder
+        if self.fmt == "csv":
+            for fields in csv.reader(lines):
+                self._line += 1
+                if self._line == 1:
+                    b.set_header(fields)
+                elif fields:
+                    b.add_csv_row(fields)
+        else:
+            for line in lines:
+                self._line += 1
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    rec = json.loads(line)
+                except json.JSONDecodeError as e:
+                    raise TimetableError(self._line, f"invalid JSON ({e.msg})")
+                b.add_record(rec)
+
+    def close(self):
+        if self.fmt == "json":
+            for rec in json_records("".join(self._chunks)):
+                self._builder.add_record(rec)
+        elif self._tail:
+            self._feed_lines([self._tail])
+            self._tail = ""
+        return self._builder.build()
@@ -18,6 +18,10 @@ const kmOf = (station) =>
 const stationNameByKM = (km) =>
   stationDistance.find((s) => s.km_from_start === km)?.station ?? "";
 
+// train object -> chart series; delta updates keep unchanged train objects,
+// so only changed trains are rebuilt
+const seriesCache = new WeakMap();
+
 export default function DistanceTimeGraph({ simulate }) {
   if (!simulate?.trains)
     return (
@@ -35,6 +39,9 @@ export default function DistanceTimeGraph({ simulate }) {
   // ----------------------------
   const graphData = useMemo(() => {
     return simulate.trains.map((train, idx) => {
+      const cached = seriesCache.get(train);
+      if (cached) return cached;
+
       let last = 0;
       const down = train.direction?.toUpperCase() === "DOWN";
       const points = [];
@@ -64,12 +71,14 @@ export default function DistanceTimeGraph({ simulate }) {
         }
       });
 
-      return {
+      const series = {
         id: train.train_id ?? `Train-${idx + 1}`,
         color: train.color ?? "#000",
         data: points,
         labelPoint: points[0] ?? { x: 0, y: 0 },
       };
+      seriesCache.set(train, series);
+      return series;
     });
   }, [simulate]);
 
@@ -9,6 +9,10 @@ const AppState = ({ children }) => {
 
   const abortRef = useRef(null);
   const pollRef = useRef(null);
+  // lets the server cancel our previous run when a newer scenario arrives
+  const sessionRef = useRef(crypto.randomUUID());
+  // last full result we hold; sent as ?since= so the server returns only changed trains
+  const resultRef = useRef(null);
 
   useEffect(() => {
     return () => {
@@ -17,6 +21,32 @@ const AppState = ({ children }) => {
     };
   }, []);
 
+  // 🧩 Apply a delta response on top of the result we already hold.
+  // Unchanged trains keep their object identity, so the chart skips them.
+  const applyResult = (data) => {
+    let next = data;
+    if (data.delta) {
+      const prev = resultRef.current;
+      // stale delta (we moved on since it was requested): the next poll catches up
+      if (prev?.run_id !== data.delta.since) return;
+      // same run as the one we hold (e.g. polling): nothing to update
+      if (data.run_id === prev.run_id) return;
+      const byId = new Map(prev.trains.map((t) => [t.train_id, t]));
+      data.delta.removed.forEach((id) => byId.delete(id));
+      data.delta.changed.forEach(({ keep_segments, ...t }) => {
+        const old = byId.get(t.train_id)?.segments ?? [];
+        byId.set(t.train_id, { ...t, segments: old.slice(0, keep_segments).concat(t.segments) });
+      });
+      next = { ...data, trains: [...byId.values()] };
+      delete next.delta;
+    }
+    resultRef.current = next;
+    setSimulate(next);
+  };
+
+  const withSince = (url) =>
+    resultRef.current ? `${url}&since=${resultRef.current.run_id}` : url;
+
   // 🔁 Polling
   const startPolling = (url) => {
     if (pollRef.current) clearInterval(pollRef.current);
@@ -26,8 +56,8 @@ const AppState = ({ children }) => {
         if (abortRef.current) abortRef.current.abort();
         abortRef.current = new AbortController();
 
-        const res = await axios.get(url, { signal: abortRef.current.signal });
-        setSimulate(res.data);
+        const res = await axios.get(withSince(url), { signal: abortRef.current.signal });
+        applyResult(res.data);
       } catch (err) {
         if (err?.code === "ERR_CANCELED") return;
         console.error("Polling error:", err);
@@ -45,16 +75,17 @@ const AppState = ({ children }) => {
         auto_blocks,
         loops,
         speed_up,
+        session: sessionRef.current,
       }).toString();
 
       const finalURL = `${API_URL}/simulate?${query}`;
 
       abortRef.current = new AbortController();
-      const res = await axios.get(finalURL, {
+      const res = await axios.get(withSince(finalURL), {
         signal: abortRef.current.signal,
       });
 
-      setSimulate(res.data);
+      applyResult(res.data);
       startPolling(finalURL);
       console.log(res)
     } catch (err) {